@@ -0,0 +1,67 @@
+"""
+Compare the corpus level IOB2 <-> spans conversions with the per document ones.
+
+Usage: python benchmarks/bench_conversion.py [n_documents] [document_size]
+"""
+import random
+import sys
+import timeit
+
+from pylighter.chunk_models import Chunks, corpus_labels_to_spans, corpus_spans_to_labels
+
+
+def make_corpus_labels(n_documents, document_size, labels_names=("l1", "l2", "l3")):
+    random.seed(0)
+    labels_list = []
+    for _ in range(n_documents):
+        labels = ["O"] * document_size
+        index = random.randrange(10)
+        while index < document_size:
+            length = random.randint(1, 8)
+            label = random.choice(labels_names)
+            labels[index] = "B-" + label
+            for inside_index in range(index + 1, min(index + length, document_size)):
+                labels[inside_index] = "I-" + label
+            index += length + random.randint(1, 20)
+        labels_list.append(labels)
+    return labels_list
+
+
+def per_document_labels_to_spans(labels_list):
+    return [Chunks(labels=labels).to_spans() for labels in labels_list]
+
+
+def per_document_spans_to_labels(spans_list, sizes):
+    return [
+        Chunks.from_spans(spans, size).to_labels()
+        for spans, size in zip(spans_list, sizes)
+    ]
+
+
+def main(n_documents=10000, document_size=200):
+    labels_list = make_corpus_labels(n_documents, document_size)
+    sizes = [len(labels) for labels in labels_list]
+    spans_list = corpus_labels_to_spans(labels_list)
+
+    assert spans_list == per_document_labels_to_spans(labels_list)
+    assert corpus_spans_to_labels(spans_list, sizes) == labels_list
+
+    print(f"{n_documents} documents of {document_size} chars")
+    for name, function in [
+        (
+            "labels -> spans, per document",
+            lambda: per_document_labels_to_spans(labels_list),
+        ),
+        ("labels -> spans, corpus", lambda: corpus_labels_to_spans(labels_list)),
+        (
+            "spans -> labels, per document",
+            lambda: per_document_spans_to_labels(spans_list, sizes),
+        ),
+        ("spans -> labels, corpus", lambda: corpus_spans_to_labels(spans_list, sizes)),
+    ]:
+        duration = min(timeit.repeat(function, number=1, repeat=3))
+        print(f"{name:<32}{duration:.3f}s")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
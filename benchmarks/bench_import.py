@@ -0,0 +1,41 @@
+"""
+Measure the time to import PyLighter modules in a fresh interpreter.
+
+Usage: python benchmarks/bench_import.py [n_runs]
+"""
+import subprocess
+import sys
+import time
+
+STATEMENTS = [
+    "import pylighter",
+    "from pylighter.chunk_models import Chunks",
+    "from pylighter import AnnotationSession",
+    "from pylighter import Annotation",
+]
+
+
+def import_time(statement, n_runs=5):
+    """
+    Best time of n_runs to run the statement in a fresh interpreter, minus the time of
+    starting an interpreter that runs nothing.
+    """
+
+    def run(code):
+        times = []
+        for _ in range(n_runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], check=True)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    return max(run(statement) - run("pass"), 0)
+
+
+def main(n_runs=5):
+    for statement in STATEMENTS:
+        print(f"{statement:<45}{import_time(statement, n_runs) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
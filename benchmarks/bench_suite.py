@@ -0,0 +1,319 @@
+"""
+Measure the cost of the chunk operations, of the conversions between labels and
+chunks, of the labels checks, of the document rendering, of the export and of the
+imports.
+
+The results are written as JSON (one record per measure, with the versions used) so
+that two runs, for instance of two releases, can be compared.
+
+Usage:
+    python benchmarks/bench_suite.py [--quick] [--output results.json]
+    python benchmarks/bench_suite.py --compare old.json new.json [--threshold 1.2]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import timeit
+
+import ipywidgets
+import numpy as np
+import pandas as pd
+from bench_conversion import make_corpus_labels
+from bench_import import STATEMENTS, import_time
+
+from pylighter import AnnotationSession, config, display, utils
+from pylighter.chunk_models import Chunk, Chunks, SpanLabels
+from pylighter.storage import JournalStorage, SQLiteStorage
+
+try:
+    from importlib.metadata import version
+except ImportError:  # Python 3.7
+    version = None
+
+LABELS_NAMES = config.LABELS_NAMES
+
+
+def measure(function, repeat):
+    """
+    Best wall time of function over repeat runs, in seconds.
+    """
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def bench_add_new_chunk_and_update(n_spans, repeat):
+    random.seed(0)
+    document_size = n_spans * 10
+    spans = []
+    for _ in range(n_spans):
+        start_index = random.randrange(document_size - 10)
+        spans.append((start_index, start_index + random.randint(0, 9)))
+
+    def add_chunks():
+        chunks = Chunks(labels_size=document_size)
+        for start_index, end_index in spans:
+            chunks.add_new_chunk_and_update(Chunk(start_index, end_index, "l1"))
+
+    return {"seconds": measure(add_chunks, repeat)}
+
+
+def bench_labels_to_chunks(labels_list, repeat):
+    def labels_to_chunks():
+        for labels in labels_list:
+            Chunks(labels=labels)
+
+    return {"seconds": measure(labels_to_chunks, repeat)}
+
+
+def bench_to_labels(labels_list, repeat):
+    chunks_list = [Chunks(labels=labels) for labels in labels_list]
+
+    def to_labels():
+        for chunks in chunks_list:
+            chunks.to_labels()
+
+    return {"seconds": measure(to_labels, repeat)}
+
+
+def bench_assert_IOB2_format(labels_list, repeat):
+    return {"seconds": measure(lambda: utils.assert_IOB2_format(labels_list), repeat)}
+
+
+def empty_char_buttons_pool():
+    while True:
+        button = display.char_buttons_pool.take()
+        if button is None:
+            return
+        button.close()
+
+
+def bench_instantiate_document(document_size, renderer, pooled, repeat):
+    """
+    Display time and number of widgets created for a document. If pooled, the char
+    buttons of the previous run are reused, as when changing document in a session.
+    """
+    random.seed(0)
+    document = "".join(
+        random.choice("abcdefghijklmnopqrstuvwxyz     ") for _ in range(document_size)
+    )
+    instantiate = (
+        display.instantiate_html_document
+        if renderer == "html"
+        else display.instantiate_document
+    )
+    widgets = []
+
+    def instantiate_document():
+        live_widgets = display.live_widgets_stats()["widgets"]
+        document_display, char_buttons_or_html, _ = instantiate(
+            document,
+            config.CHAR_PARAMS,
+            lambda button, char_index: None,
+            LABELS_NAMES,
+            LABELS_NAMES[0],
+            {},
+            lambda button, button_index: None,
+        )
+        widgets.append(display.live_widgets_stats()["widgets"] - live_widgets)
+        char_buttons = char_buttons_or_html if renderer == "buttons" else None
+        display.release_core(
+            {"char_buttons": char_buttons, "core_display": document_display}
+        )
+        if not pooled:
+            empty_char_buttons_pool()
+
+    empty_char_buttons_pool()
+    if pooled:
+        # Fill the pool
+        instantiate_document()
+    seconds = measure(instantiate_document, repeat)
+    empty_char_buttons_pool()
+    return {"seconds": seconds, "widgets": widgets[-1]}
+
+
+def bench_annotation_to_csv(labels_list, labels_format, repeat):
+    """
+    Save of the labels of a session in a csv, and read back of the csv.
+    """
+    corpus = ["a" * len(labels) for labels in labels_list]
+    labels = SpanLabels.from_labels(labels_list)
+    additional_outputs_values = pd.DataFrame({"flag": [False] * len(corpus)})
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, "annotation.csv")
+        seconds = measure(
+            lambda: utils.annotation_to_csv(
+                corpus,
+                labels,
+                additional_outputs_values,
+                file_path,
+                labels_format=labels_format,
+            ),
+            repeat,
+        )
+        size = os.path.getsize(file_path)
+        read_seconds = measure(lambda: utils.read_annotation_csv(file_path), repeat)
+    return {"seconds": seconds, "bytes": size, "read_seconds": read_seconds}
+
+
+STORAGES = {
+    "journal": lambda directory: JournalStorage(
+        os.path.join(directory, "annotation.jsonl")
+    ),
+    "sqlite": lambda directory: SQLiteStorage(os.path.join(directory, "annotation.db")),
+}
+
+
+def bench_save_to_storage(labels_list, storage_name, n_changed, repeat):
+    """
+    Save of a session to a storage after n_changed documents changed.
+    """
+    corpus = ["a" * len(labels) for labels in labels_list]
+    with tempfile.TemporaryDirectory() as directory:
+        session = AnnotationSession(
+            corpus,
+            labels=labels_list,
+            storage=STORAGES[storage_name](directory),
+        )
+
+        def save():
+            session.dirty.update(range(n_changed))
+            session.save()
+
+        seconds = measure(save, repeat)
+        session.storage.close()
+    return {"seconds": seconds}
+
+
+def run(quick=False):
+    repeat = 1 if quick else 3
+    n_documents = 1000 if quick else 10000
+    document_sizes = [1000, 10000] if quick else [1000, 10000, 50000]
+    labels_list = make_corpus_labels(n_documents, 200)
+    corpus_params = {"n_documents": n_documents, "document_size": 200}
+
+    results = []
+
+    def record(name, params, measures):
+        results.append({"name": name, "params": params, **measures})
+        details = ", ".join(f"{key}={value}" for key, value in params.items())
+        print(
+            f"{name:<26}{details:<58}{measures['seconds']:.3f}s", file=sys.stderr
+        )
+
+    for n_spans in [1000, 10000]:
+        record(
+            "add_new_chunk_and_update",
+            {"n_spans": n_spans},
+            bench_add_new_chunk_and_update(n_spans, repeat),
+        )
+    record("labels_to_chunks", corpus_params, bench_labels_to_chunks(labels_list, repeat))
+    record("to_labels", corpus_params, bench_to_labels(labels_list, repeat))
+    record(
+        "assert_IOB2_format", corpus_params, bench_assert_IOB2_format(labels_list, repeat)
+    )
+    for renderer in config.RENDERERS:
+        for pooled in [False, True] if renderer == "buttons" else [False]:
+            for document_size in document_sizes:
+                # Buttons are slow to create, one run is enough for long documents
+                record(
+                    "instantiate_document",
+                    {
+                        "document_size": document_size,
+                        "renderer": renderer,
+                        "pooled": pooled,
+                    },
+                    bench_instantiate_document(
+                        document_size,
+                        renderer,
+                        pooled,
+                        repeat if document_size <= 1000 else 1,
+                    ),
+                )
+    for labels_format in config.LABELS_FORMATS:
+        record(
+            "annotation_to_csv",
+            {"labels_format": labels_format, **corpus_params},
+            bench_annotation_to_csv(labels_list, labels_format, repeat),
+        )
+    for storage_name in STORAGES:
+        record(
+            "save_to_storage",
+            {"storage": storage_name, "n_changed": 10, **corpus_params},
+            bench_save_to_storage(labels_list, storage_name, 10, repeat),
+        )
+    for statement in STATEMENTS:
+        record(
+            "import",
+            {"statement": statement},
+            {"seconds": import_time(statement, repeat)},
+        )
+
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "versions": {
+            "pylighter": version("pylighter") if version else None,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "ipywidgets": ipywidgets.__version__,
+        },
+        "quick": quick,
+        "results": results,
+    }
+
+
+def result_key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def compare(old_path, new_path, threshold):
+    """
+    Print the ratio of the new times over the old ones. Return the number of measures
+    slower than threshold times the old one.
+    """
+    with open(old_path) as old_file, open(new_path) as new_file:
+        old_results = {
+            result_key(result): result for result in json.load(old_file)["results"]
+        }
+        new_results = json.load(new_file)["results"]
+
+    regressions = 0
+    for new_result in new_results:
+        old_result = old_results.get(result_key(new_result))
+        if old_result is None:
+            continue
+        ratio = new_result["seconds"] / old_result["seconds"]
+        regression = ratio > threshold
+        regressions += regression
+        print(
+            f"{new_result['name']:<26}{result_key(new_result)[1]:<72}"
+            f"x{ratio:.2f}{'  <- regression' if regression else ''}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="smaller inputs, 1 run")
+    parser.add_argument("--output", help="JSON file to write, stdout by default")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    results = run(quick=args.quick)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
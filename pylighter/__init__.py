@@ -1,5 +1,37 @@
-from .annotation import Annotation
-from .shortcut_helper.shortcut_helper import Shortcut, ShortcutHelper
-from .utils import AdditionalOutputElement
+import importlib
 
-__all__ = ["Annotation", "AdditionalOutputElement", "Shortcut", "ShortcutHelper"]
+# The public objects are imported when first accessed, so that importing a light
+# module such as pylighter.chunk_models does not import pandas, ipywidgets and IPython
+_LAZY_ATTRIBUTES = {
+    "Annotation": ".annotation",
+    "AnnotationSession": ".session",
+    "AdditionalOutputElement": ".utils",
+    "Shortcut": ".shortcut_helper.shortcut",
+    "ShortcutHelper": ".shortcut_helper.shortcut_helper",
+}
+
+__all__ = [
+    "Annotation",
+    "AnnotationSession",
+    "AdditionalOutputElement",
+    "Shortcut",
+    "ShortcutHelper",
+]
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+        return getattr(module, name)
+
+    try:
+        # Submodules, e.g. pylighter.display after import pylighter
+        return importlib.import_module(f".{name}", __name__)
+    except ModuleNotFoundError as err:
+        if err.name != f"{__name__}.{name}":
+            raise
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
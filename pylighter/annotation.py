@@ -1,18 +1,16 @@
-import os
-import threading
-
-import pandas as pd
-
 from pylighter import config
 from pylighter import display as display_helper
 from pylighter import utils
-from pylighter.chunk_models import Chunk, Chunks
+from pylighter.instrumentation import InteractionStats, instrumented
+from pylighter.session import AnnotationSession
 from pylighter.shortcut_helper import shortcut_helper
+from pylighter.storage import Autosave
 
 
-class Annotation:
+class Annotation(AnnotationSession):
     """
-    Class used to annotate datasets.
+    Class used to annotate datasets. It is the widget front end of an
+    AnnotationSession.
     """
 
     # --------------------------------------------
@@ -23,7 +21,7 @@ class Annotation:
         self,
         corpus,
         labels=None,
-        start_index=0,
+        start_index=None,
         save_path=config.ANNOTATION_SAVE_PATH,
         labels_names=config.LABELS_NAMES,
         labels_colors=config.DEFAULT_COLORS,
@@ -33,6 +31,19 @@ class Annotation:
         standard_shortcuts=config.SHORTCUTS,
         labels_shortcuts=None,
         char_params=config.CHAR_PARAMS,
+        renderer=config.DEFAULT_RENDERER,
+        window_size=None,
+        preload_ahead=config.PRELOAD_AHEAD,
+        preload_behind=config.PRELOAD_BEHIND,
+        max_preloaded_documents=config.MAX_PRELOADED_DOCUMENTS,
+        max_preloaded_chars=config.MAX_PRELOADED_CHARS,
+        persistent_shell=config.PERSISTENT_SHELL,
+        storage=None,
+        labels_format=config.DEFAULT_LABELS_FORMAT,
+        autosave_interval=config.AUTOSAVE_INTERVAL,
+        autosave_every=config.AUTOSAVE_EVERY,
+        track_interactions=False,
+        on_interaction=None,
     ):
         """
         Class that starts the user interface to annotate the given corpus.
@@ -41,13 +52,14 @@ class Annotation:
         ----------
         corpus : List[str]
              The corpus to annotate.
-        labels : List[List[str]], optional
+        labels : List[List[str]] or SpanLabels, optional
             The labels of the documents. It must have the same length as documents.
             Moreover, the i-th label must have the same length as the number of
             characters of the i-th document.
             By default, none of the documents are annotated.
         start_index : int, optional
-            The index of the document to start on. Default value is 0.
+            The index of the document to start on. By default, the index of the
+            current document at the last save in the storage, else 0.
         save_path : str, optional
             Path to store the annotated corpus into a csv when clicking the save button.
             By default, the (document, labels) are stored in config.ANNOTATION_SAVE_PATH.
@@ -85,24 +97,103 @@ class Annotation:
                 width_white_space -- Size of a white space. Expects a css value as
                                             string (ex: "10px").
                 font_size -- Size of the font. Expects a css value as string (ex:"large").
+        renderer : str, optional
+            How to display the document, one of config.RENDERERS:
+                buttons -- Every char is a button.
+                html -- The document is a single HTML widget and clicks are handled in
+                        the browser. Its render time barely depends on the size of the
+                        document.
+            Default value is config.DEFAULT_RENDERER.
+        window_size : int, optional
+            With the "buttons" renderer, maximum number of chars displayed at a time.
+            Longer documents are split into windows (cut after a space when possible)
+            that are displayed one at a time with buttons to move between them.
+            By default, the whole document is displayed.
+        preload_ahead : int, optional
+            Number of documents preloaded after the current one. Default value is
+            config.PRELOAD_AHEAD.
+        preload_behind : int, optional
+            Number of documents preloaded before the current one. Default value is
+            config.PRELOAD_BEHIND.
+        max_preloaded_documents : int, optional
+            Maximum number of preloaded documents kept in memory, the least recently
+            used are dropped first. None for no limit. Default value is
+            config.MAX_PRELOADED_DOCUMENTS.
+        max_preloaded_chars : int, optional
+            Maximum total number of chars of the preloaded documents kept in memory.
+            None for no limit. Default value is config.MAX_PRELOADED_CHARS.
+        persistent_shell : bool, optional
+            If True, the header, buttons, additional outputs, footer and styles are
+            displayed once, and changing document only swaps the document display, the
+            index and the values of the additional infos and outputs.
+            Default value is config.PERSISTENT_SHELL.
+        storage : storage.Storage, optional
+            Where the save button writes the documents changed since the last save
+            (a storage.JournalStorage or storage.SQLiteStorage), instead of rewriting
+            the whole corpus into the save_path csv. The documents already saved in it
+            are restored. By default, the save button writes the csv.
+        labels_format : str, optional
+            Format of the labels in the saved csv, one of config.LABELS_FORMATS:
+                iob2 -- A "labels" column with the list of the IOB2 labels of every
+                        char.
+                spans -- A "spans" column with the (start, end, label) spans of the
+                         document as JSON, end included. Much smaller and faster to
+                         read back.
+            Default value is config.DEFAULT_LABELS_FORMAT.
+        autosave_interval : float, optional
+            Seconds between two saves in the background. Default value is
+            config.AUTOSAVE_INTERVAL.
+        autosave_every : int, optional
+            Number of changes of document between two saves in the background.
+            Default value is config.AUTOSAVE_EVERY.
+            With autosave_interval or autosave_every, the save button also saves in
+            the background, and the saves are written with session.save semantics to
+            a temporary file or the storage.
+        track_interactions : bool, optional
+            If True, the time of the callbacks (labelise, change document, save,
+            preloads...), the widgets they create and the comm messages they send are
+            measured in annotation.interaction_stats, until it is closed. Default
+            value is False.
+        on_interaction : Callable[[instrumentation.Interaction], None], optional
+            Called with the measure of every callback, it implies track_interactions.
         """
-        # Check input consistency
-        utils.assert_input_consistency(corpus, labels, start_index)
-
-        # Init "global" variables
-        self.start_index = start_index
-        self.current_index = start_index
-        self.corpus = corpus
-        self.labels = self._init_labels(labels)
-        self.save_path = save_path
+        if renderer not in config.RENDERERS:
+            raise ValueError(f"renderer must be one of those {config.RENDERERS}")
+
+        super().__init__(
+            corpus,
+            labels=labels,
+            start_index=start_index,
+            save_path=save_path,
+            labels_names=labels_names,
+            additional_outputs_values=additional_outputs_values,
+            additional_outputs_elements=additional_outputs_elements,
+            storage=storage,
+            labels_format=labels_format,
+        )
+
+        self.interaction_stats = None
+        if track_interactions or on_interaction is not None:
+            self.interaction_stats = InteractionStats(on_interaction)
+
+        self.autosave = None
+        if autosave_interval is not None or autosave_every is not None:
+            self.autosave = Autosave(
+                self,
+                interval=autosave_interval,
+                every=autosave_every,
+                on_save=self._show_saved,
+                on_error=self._show_save_error,
+            )
+
+        # Init display variables
         self.char_params = char_params
+        self.renderer = renderer
+        self.window_size = window_size
+        self.persistent_shell = persistent_shell
+        self.shell = None
         self.additional_infos = additional_infos
-        self._init_additional_outputs(
-            additional_outputs_values, additional_outputs_elements
-        )
-        self.labels_names = labels_names
         self.labels_colors = self._init_labels_colors(labels_colors)
-        self.threads = []
 
         display_helper.start_display()
 
@@ -115,40 +206,23 @@ class Annotation:
         display_helper.define_keyboard_shortcuts(
             all_shortcuts, self.shortcuts_displays_helpers
         )
-
-        self.preloaded_displays = utils.PreloadedDisplays()
+        if self.renderer == "html":
+            display_helper.define_click_delegation()
+
+        self.preloaded_displays = utils.PreloadedDisplays(
+            preload_ahead=preload_ahead,
+            preload_behind=preload_behind,
+            max_documents=max_preloaded_documents,
+            max_chars=max_preloaded_chars,
+            on_drop=display_helper.release_core,
+        )
+        self.preload_scheduler = utils.PreloadScheduler(
+            max_workers=config.PRELOAD_WORKERS
+        )
 
         # Start annotating
         self._annotate()
 
-    def _init_labels(self, labels):
-        """
-        Init labels as "empty" if not labels are given
-        """
-        if not labels:
-            labels = []
-            for document in self.corpus:
-                labels.append(["O"] * len(document))
-
-        return labels
-
-    def _init_additional_outputs(
-        self, additional_outputs_values, additional_outputs_elements
-    ):
-        self.additional_outputs_elements = additional_outputs_elements
-        if (
-            additional_outputs_elements is not None
-            and additional_outputs_values is None
-        ):
-            # Create empty dataframe if none is given
-            columns = [element.name for element in additional_outputs_elements]
-            self.additional_outputs_values = pd.DataFrame(
-                columns=columns, index=range(len(self.corpus))
-            )
-        else:
-            # Use given data
-            self.additional_outputs_values = additional_outputs_values
-
     def _init_labels_colors(self, labels_colors_hex):
         labels_colors = []
         for index, label_name in enumerate(self.labels_names):
@@ -165,86 +239,169 @@ class Annotation:
     # Main
     # --------------------------------------------
 
+    @instrumented
     def _annotate(self):
         """
         Method to annotate the current document. It is responsible for setting up the
         user interface and the variables needed on buttons clicked.
         """
-
-        # Init variables specific to the current document
-        self.document = self.corpus[self.current_index]
-        self.chunks = Chunks(labels=self.labels[self.current_index])
-        self.selected_labeliser = self.labels_names[0]
-        self.label_start_index = None
         self.additional_outputs_elements_displays = None
+        # Widgets to close when leaving the document, except the core display which is
+        # released when it leaves the preloaded displays
+        self.document_widgets = []
 
         # Display loader until the display is finished
-        loader = display_helper.display_loader()
+        loader = None
+        if self.shell is None:
+            loader = display_helper.display_loader()
+
+        # Cancel the preloads of the documents the user jumped away from, load current
+        # core if not preloaded, and make room for the documents around
+        preload_window = self.preloaded_displays.window(
+            self.current_index, len(self.corpus)
+        )
+        self.preload_scheduler.cancel_stale(keep=preload_window)
+        preloaded = {
+            index: self.preloaded_displays.get(
+                index, len(self.corpus[index]), count=index == self.current_index
+            )
+            for index in preload_window[::-1]
+        }
+        self.preloaded_displays.evict(
+            protected=preload_window, defer=self.preload_scheduler.when_done
+        )
+        current_preloaded = preloaded[self.current_index]
+        self._load_current(current_preloaded)
+        self.char_buttons = current_preloaded["char_buttons"]
+        self.html_document = current_preloaded["html_document"]
+        self.labels_buttons = current_preloaded["labels_buttons"]
+        self.chunk_area = current_preloaded["chunk_area"]
+
+        if self.persistent_shell:
+            self._show_in_shell(current_preloaded["core_display"])
+        else:
+            self._display_document(current_preloaded["core_display"])
+
+        # Display current chunks and their highlights at once
+        self.chunk_area.set_chunks(
+            [(chunk, self.chunk_text(chunk)) for chunk in self.chunks.chunks],
+            self._delete_chunk,
+        )
+        self._highlight_document()
+
+        # Remove loader
+        if loader is not None:
+            display_helper.remove_loader(loader)
 
-        # Load current core if not preloaded
-        self._async_load(self.preloaded_displays.current, 0)
+        # Preload missing displays
+        for index in preload_window[1:]:
+            self._async_load(preloaded[index], index - self.current_index)
 
-        # Define custom styles
+    def _display_document(self, core_display):
+        """
+        Display the whole user interface for the current document.
+        """
+        # Define custom styles, kept for the session
         display_helper.define_custom_styles(self.labels_colors, self.char_params)
 
         # Display header
-        display_helper.display_header(
-            self.current_index,
-            len(self.corpus),
-            self._change_document,
-            self.additional_infos,
+        self.document_widgets.append(
+            display_helper.display_header(
+                self.current_index,
+                len(self.corpus),
+                self._change_document,
+                self.additional_infos,
+            )
         )
 
         # Display moving buttons
-        display_helper.display_top_buttons(
-            self._change_document,
-            self._clear_current,
-            self.shortcuts_displays_helpers,
+        self.document_widgets.append(
+            display_helper.display_top_buttons(
+                self._change_document,
+                self._clear_current,
+                self.shortcuts_displays_helpers,
+            )
         )
 
         # Display document, toolbox and chunk area
-        utils.wait_for_threads(self.threads)
-        display_helper.display_core(self.preloaded_displays.current["core_display"])
-        self.char_buttons = self.preloaded_displays.current["char_buttons"]
-        self.labels_buttons = self.preloaded_displays.current["labels_buttons"]
-
-        # Display current chunks
-        for chunk in self.chunks.chunks:
-            self._sync_chunks(
-                chunk, self.document[chunk.start_index : chunk.end_index + 1]  # noqa
-            )
+        display_helper.display_core(core_display)
 
         if self.additional_outputs_elements:
-            self.additional_outputs_elements_displays = (
-                display_helper.display_additional_outputs(
-                    self.additional_outputs_elements,
-                    self.additional_outputs_values.iloc[self.current_index],
-                )
+            (
+                self.additional_outputs_elements_displays,
+                additional_outputs_display,
+            ) = display_helper.display_additional_outputs(
+                self.additional_outputs_elements,
+                self.additional_outputs_values.iloc[self.current_index],
             )
+            self.document_widgets.append(additional_outputs_display)
 
         # Display footer
-        display_helper.display_footer(
-            self._save,
-            self._quit,
-            self.shortcuts_displays_helpers,
+        self.document_widgets.append(
+            display_helper.display_footer(
+                self._save,
+                self._quit,
+                self.shortcuts_displays_helpers,
+            )
         )
 
-        # Remove loader
-        display_helper.remove_loader(loader)
-
-        # Prepare toast for on_save
+        # Prepare toast for on_save, kept for the session
         display_helper.prepare_toast()
 
-        # Preload missing displays
-        self._async_load(self.preloaded_displays.next, 1)
-        self._async_load(self.preloaded_displays.previous, -1)
+    def _show_in_shell(self, core_display):
+        """
+        Show the current document in the persistent shell, displayed the first time.
+        """
+        additional_outputs_values = None
+        if self.additional_outputs_elements:
+            additional_outputs_values = self.additional_outputs_values.iloc[
+                self.current_index
+            ]
+
+        if self.shell is None:
+            self.shell = display_helper.display_shell(
+                labels_colors=self.labels_colors,
+                char_params=self.char_params,
+                current_index=self.current_index,
+                corpus_size=len(self.corpus),
+                move_function=self._change_document,
+                clear_function=self._clear_current,
+                save_function=self._save,
+                quit_function=self._quit,
+                shortcuts_displays_helpers=self.shortcuts_displays_helpers,
+                df_additional_infos=self.additional_infos,
+                additional_outputs_elements=self.additional_outputs_elements,
+                additional_outputs_values=additional_outputs_values,
+            )
+
+        self.shell.show_document(
+            self.current_index, core_display, additional_outputs_values
+        )
+        self.additional_outputs_elements_displays = (
+            self.shell.additional_outputs_inputs
+        )
+
+    def _load_current(self, preloaded):
+        """
+        Compute the core display of the current document in the current thread if it
+        is not preloaded yet, so that it does not wait behind the other preloads. If
+        it is being preloaded, wait for it instead.
+        """
+        if preloaded and self.current_index not in self.preload_scheduler:
+            return
+
+        self.preload_scheduler.run_now(
+            self.current_index,
+            self._preload_core,
+            **self._preload_kwargs(preloaded, self.current_index),
+        )
 
     def _async_load(self, preloaded, direction):
         """
         Compute the core display (ie toolbox, document and chunk area) and stores it in
-        the preloaded object if not already precomputed. The displays are computed in
-        other threads, so make sure to join the threads before accessing/updating any
-        value in the preloaded object.
+        the preloaded object if not already precomputed. The displays are computed by
+        the preload scheduler in other threads, so make sure to wait for the preload
+        before accessing/updating any value in the preloaded object.
 
 
         Parameters
@@ -253,33 +410,44 @@ class Annotation:
             Object for storing the values returned by the display if the dict is empty.
             Values are:
             - core_display {ipywidgets.Box}: The widget that represents the core display.
-            - char_buttons {List[ipywidgets.Button]}: The buttons for every char.
+            - char_buttons {List[ipywidgets.Button] or display.CharWindow}: The buttons
+              for every char, with the "buttons" renderer.
+            - html_document {display.HTMLDocument}: The document, with the "html"
+              renderer.
             - labels_buttons {List[ipywidgets.Button]}: The buttons for every label.
         direction : int
             Represents the direction (and the distance) to the next document.
             For instance, if the direction equals 2 then it preloads the document at
             current index + 2.
         """
-        if (
-            not preloaded
-            and self.current_index + direction < len(self.corpus)
-            and self.current_index + direction >= 0
-        ):
-            thread = threading.Thread(
-                target=display_helper.preload_core,
-                kwargs={
-                    "obj": preloaded,
-                    "document": self.corpus[self.current_index + direction],
-                    "char_params": self.char_params,
-                    "char_on_click": self._labelise,
-                    "labels_names": self.labels_names,
-                    "selected_labeliser": self.labels_names[0],
-                    "shortcuts_displays_helpers": self.shortcuts_displays_helpers,
-                    "label_on_click": self._select_new_labeliser,
-                },
+        index = self.current_index + direction
+        if not preloaded and index < len(self.corpus) and index >= 0:
+            self.preload_scheduler.submit(
+                index,
+                self._preload_core,
+                **self._preload_kwargs(preloaded, index),
             )
-            thread.start()
-            self.threads.append(thread)
+
+    @instrumented
+    def _preload_core(self, document_index, **kwargs):
+        display_helper.preload_core(**kwargs)
+
+    def _preload_kwargs(self, preloaded, index):
+        return {
+            "document_index": index,
+            "obj": preloaded,
+            "document": self.corpus[index],
+            "char_params": self.char_params,
+            "char_on_click": self._labelise,
+            "labels_names": self.labels_names,
+            "selected_labeliser": self.labels_names[0],
+            "shortcuts_displays_helpers": self.shortcuts_displays_helpers,
+            "label_on_click": self._select_new_labeliser,
+            "renderer": self.renderer,
+            "window_size": self.window_size,
+            "window_on_move": self._highlight_window,
+            "labels_colors": self.labels_colors,
+        }
 
     # --------------------------------------------
     # On click functions
@@ -301,54 +469,26 @@ class Annotation:
             or self.labels_buttons[button_index].icon
         )
         self.labels_buttons[button_index].add_class(f"{description}_color_selected")
-        self.selected_labeliser = self.labels_buttons[button_index].description
         if button_index == len(self.labels_buttons) - 1:
             # Selects the eraser
-            self.selected_labeliser = None
-
-        # Restart the index to none
-        self.label_start_index = None
-
-    def _labelise(self, button, char_index):
-        # Selecting the first part and create chunks accordingly
-        if self.label_start_index is None:
-            chunk = Chunk(
-                start_index=char_index,
-                end_index=char_index,
-                label=self.selected_labeliser,
-            )
-            self.label_start_index = char_index
-
-        # Selecting the second part and create chunks accordingly
+            self.select_label(None)
         else:
-            start_index = self.label_start_index
-            end_index = char_index
-            if end_index < start_index:
-                start_index, end_index = end_index, start_index
-
-            chunk = Chunk(
-                start_index=start_index,
-                end_index=end_index,
-                label=self.selected_labeliser,
-            )
-            self.label_start_index = None
+            self.select_label(self.labels_buttons[button_index].description)
 
-        # Update chunks with the new chunk
-        chunk_text = self.document[chunk.start_index : chunk.end_index + 1]  # noqa
-        updated_chunks, removed_chunks = self.chunks.add_new_chunk_and_update(chunk)
-
-        # Remove the freshly created chunk if the eraser is selected
-        display_new_chunk = True
-        if self.selected_labeliser is None:
-            self.chunks.remove_chunk_by_id(chunk.id)
-            display_new_chunk = False
-            chunk.display_id = None
+    @instrumented
+    def _labelise(self, button, char_index):
+        update = self.labelise(char_index)
 
         # Sync the display with the chunks
         self._sync_chunks(
-            chunk, chunk_text, updated_chunks, removed_chunks, display_new_chunk
+            update.chunk,
+            self.chunk_text(update.chunk),
+            update.updated_chunks,
+            update.removed_chunks,
+            update.added,
         )
 
+    @instrumented
     def _sync_chunks(
         self,
         chunk,
@@ -361,119 +501,178 @@ class Annotation:
         Sync the given chunk display with the current state of the chunks.
         """
         # Display new char highlight
-        display_helper.highlight_chars(
-            char_buttons=self.char_buttons[
-                chunk.start_index : chunk.end_index + 1  # noqa
-            ],
-            selected_labeliser=chunk.label,
-            labels_names=self.labels_names,
-            undo=False,
-        )
+        self._highlight_chars(chunk, undo=False)
 
         # Remove chunks from display
         for chunk_removed in removed_chunks:
-            display_helper.remove_chunk(chunk_removed)
+            self.chunk_area.remove(chunk_removed)
 
         # Update chunks text
         for chunk_updated in updated_chunks:
-            display_helper.update_chunk_text(
-                self.document[
-                    chunk_updated.start_index : chunk_updated.end_index + 1  # noqa
-                ],
+            self.chunk_area.update(
                 chunk_updated,
+                self.chunk_text(chunk_updated),
                 delete_chunk_on_click=self._delete_chunk,
             )
 
         # Display new chunk
         if display_chunk:
-            display_helper.display_chunk(
-                chunk,
-                chunk_text,
-                self._delete_chunk,
-            )
+            self.chunk_area.add(chunk, chunk_text, self._delete_chunk)
 
+    @instrumented
     def _delete_chunk(self, button, chunk):
         # Remove chunk from chunks
-        self.chunks.remove_chunk_by_id(chunk.id)
+        self.delete_chunk(chunk)
 
         # Remove chunk
-        display_helper.remove_chunk(chunk)
+        self.chunk_area.remove(chunk)
 
         # Remove char chunk highlight
+        self._highlight_chars(chunk, undo=True)
+
+    def _highlight_window(self, char_window):
+        """
+        Highlight the chunks of the window that has just been displayed.
+        """
+        chunks = self.chunks.overlapping(
+            char_window.window_start, char_window.window_end - 1
+        )
+        display_helper.highlight_spans(
+            char_window[char_window.window_start : char_window.window_end],  # noqa
+            [(chunk.start_index, chunk.end_index, chunk.label) for chunk in chunks],
+            self.labels_names,
+            offset=char_window.window_start,
+        )
+
+    def _highlight_document(self):
+        """
+        Highlight all the chunks of the document, and remove the highlights left by a
+        previous visit of the document.
+        """
+        if self.html_document is not None:
+            self.html_document.highlight(self.chunks.to_spans())
+        elif isinstance(self.char_buttons, display_helper.CharWindow):
+            self._highlight_window(self.char_buttons)
+        else:
+            display_helper.highlight_spans(
+                self.char_buttons, self.chunks.to_spans(), self.labels_names
+            )
+
+    def _highlight_chars(self, chunk, undo):
+        """
+        Highlight the chars of the given chunk, or remove their highlight if undo is
+        True. The chunks must already be up to date.
+        """
+        if self.html_document is not None:
+            # The whole document highlight is a single style element
+            self.html_document.highlight(self.chunks.to_spans())
+            return
+
         display_helper.highlight_chars(
             char_buttons=self.char_buttons[
                 chunk.start_index : chunk.end_index + 1  # noqa
             ],
             selected_labeliser=chunk.label,
             labels_names=self.labels_names,
-            undo=True,
+            undo=undo,
         )
 
+    @instrumented
     def _change_document(self, button, direction, skip=False):
         """
         Go from the current document at index i to the document at index i + direction.
         If skip is True, the current annotation is not added to the labels.
         """
-        # Add current annotation to the labels if skip is False
-        if not skip:
-            self.labels[self.current_index] = self.chunks.to_labels()
-
-            # Update additional outputs values
-            if self.additional_outputs_elements:
-                for index, element in enumerate(self.additional_outputs_elements):
-                    self.additional_outputs_values.iloc[self.current_index][
-                        element.name
-                    ] = self.additional_outputs_elements_displays[index].value
-
-        if self.current_index + direction < 0:
-            return
+        additional_outputs = None
+        if self.additional_outputs_elements:
+            additional_outputs = {
+                element.name: element_display.value
+                for element, element_display in zip(
+                    self.additional_outputs_elements,
+                    self.additional_outputs_elements_displays,
+                )
+            }
 
-        # Move to the next document
-        self.current_index += direction
+        if not self.change_document(direction, skip, additional_outputs):
+            return
+        if self.autosave is not None:
+            self.autosave.document_changed()
 
-        # Clear the current display
-        display_helper.clear_display()
+        # Clear the current display, the persistent shell stays
+        self._close_document_widgets()
+        if self.shell is None:
+            display_helper.clear_display()
 
-        if self.current_index >= len(self.corpus):
+        if self.finished:
             # All done
             self._save()
             self._quit()
         else:
             # Continue annotation
-            utils.wait_for_threads(self.threads)
-            self.preloaded_displays.update(direction)
             self._annotate()
 
+    def _close_document_widgets(self):
+        """
+        Close the widgets of the current document that are not preloaded, so that they
+        do not pile up in the kernel and the front end.
+        """
+        for widget in self.document_widgets:
+            display_helper.close_widgets(widget)
+        self.document_widgets = []
+
+        # The chunk area is preloaded, it is empty when coming back to the document
+        self.chunk_area.clear()
+
+    @instrumented
     def _clear_current(self, button):
-        # Clearing the current document <=> Using the eraser on the whole document.
-        current_labeliser = self.selected_labeliser
-        self.selected_labeliser = None
-        self.label_start_index = 0
-        self._labelise(None, len(self.document) - 1)
-        self.selected_labeliser = current_labeliser
+        update = self.clear_current()
+        self._sync_chunks(
+            update.chunk,
+            self.chunk_text(update.chunk),
+            update.updated_chunks,
+            update.removed_chunks,
+            update.added,
+        )
 
+    @instrumented
     def _save(self, button=None, file_path=None):
         """
-        Saves the current state of the corpus and the labels into a csv.
+        Saves the current state of the corpus and the labels into a csv, in the
+        background with autosave.
         """
-        try:
-            # Save file in path
-            if not file_path:
-                file_path = self.save_path
-            file_path = os.path.abspath(file_path)
-            utils.annotation_to_csv(
-                self.corpus, self.labels, self.additional_outputs_values, file_path
-            )
+        if self.autosave is not None and not file_path:
+            self.autosave.request(notify=True)
+            return
 
-            # Display success toast
-            display_helper.show_toast(
-                msg=f"File successfully saved in <b>{file_path}</b> !", success=True
-            )
+        try:
+            self._show_saved(self.save(file_path))
         except Exception as err:
-            # Display error toast with error message
-            display_helper.show_toast(msg=str(err), success=False)
+            self._show_save_error(err)
+
+    def _show_saved(self, file_path):
+        # Display success toast
+        display_helper.show_toast(
+            msg=f"File successfully saved in <b>{file_path}</b> !", success=True
+        )
+
+    def _show_save_error(self, err):
+        # Display error toast with error message
+        display_helper.show_toast(msg=str(err), success=False)
 
     def _quit(self, button=None):
+        # Close all the widgets
+        self._close_document_widgets()
+        if self.shell is not None:
+            self.shell.close()
+            self.shell = None
+        self.preload_scheduler.shutdown()
+        self.preloaded_displays.clear()
+        if self.autosave is not None:
+            # Write the last saves
+            self.autosave.stop()
+        if self.storage is not None:
+            self.storage.close()
+
         # Display end screen
         display_helper.clear_display()
         display_helper.display_quit_text(
@@ -1,17 +1,27 @@
-from datetime import datetime
+import bisect
+import itertools
+
+import numpy as np
+
+# Ids of the chunks, unique for the whole process
+_chunk_ids = itertools.count()
 
 
 class Chunk:
+    __slots__ = (
+        "id",
+        "start_index",
+        "end_index",
+        "label",
+    )
+
     def __init__(self, start_index, end_index, label):
-        self.id = str(datetime.now()).replace(" ", "")
-        self.display_id = f"id_class_chunk_{self.id}"
+        self.id = next(_chunk_ids)
 
         self.start_index = start_index
         self.end_index = end_index
         self.label = label
 
-        self.text_display = None
-
     def update(self, start_index=None, end_index=None, label=None):
         if start_index is not None:
             self.start_index = start_index
@@ -26,6 +36,14 @@ class Chunk:
 
 
 class Chunks:
+    """
+    Chunks of a document, kept sorted by start index.
+
+    Chunks never overlap, so sorting them by start index also sorts them by end index.
+    This lets every operation find the chunks it touches by bisecting over the start
+    indices instead of scanning the whole document.
+    """
+
     def __init__(
         self,
         labels=None,
@@ -35,29 +53,96 @@ class Chunks:
             raise ValueError("Chunks init need either 'labels_size' or 'labels'.")
 
         self.chunks = []
+        self._starts = []
+        self._chunks_by_id = {}
         self.labels_size = labels_size
 
         if labels:
-            self.chunks = self.labels_to_chunks(labels)
+            self._reset(self.labels_to_chunks(labels))
             self.labels_size = len(labels)
 
+    def _reset(self, chunks):
+        self.chunks = sorted(chunks, key=lambda chunk: chunk.start_index)
+        self._starts = [chunk.start_index for chunk in self.chunks]
+        self._chunks_by_id = {chunk.id: chunk for chunk in self.chunks}
+
+    def _position(self, chunk):
+        """
+        Return the position of the given chunk in self.chunks, or None if it is not
+        stored.
+        """
+        position = bisect.bisect_left(self._starts, chunk.start_index)
+        while (
+            position < len(self.chunks)
+            and self._starts[position] == chunk.start_index
+        ):
+            if self.chunks[position] is chunk:
+                return position
+            position += 1
+        return None
+
+    def _overlapping_positions(self, start_index, end_index):
+        first = bisect.bisect_left(self._starts, start_index)
+        if first > 0 and self.chunks[first - 1].end_index >= start_index:
+            first -= 1
+        last = bisect.bisect_right(self._starts, end_index)
+        return first, last
+
+    def overlapping(self, start_index, end_index):
+        """
+        Return the chunks that overlap the chars from start_index to end_index
+        (included).
+        """
+        first, last = self._overlapping_positions(start_index, end_index)
+        return self.chunks[first:last]
+
+    def get_chunk_by_id(self, chunk_id):
+        return self._chunks_by_id.get(chunk_id)
+
     def add_chunk(self, chunk):
-        self.chunks.append(chunk)
+        position = bisect.bisect_right(self._starts, chunk.start_index)
+        self.chunks.insert(position, chunk)
+        self._starts.insert(position, chunk.start_index)
+        self._chunks_by_id[chunk.id] = chunk
+
+    def remove_chunk(self, chunk):
+        position = self._position(chunk)
+        if position is None:
+            return
+
+        del self.chunks[position]
+        del self._starts[position]
+        if self._chunks_by_id.get(chunk.id) is chunk:
+            del self._chunks_by_id[chunk.id]
 
     def remove_chunk_by_id(self, chunk_id):
-        for index, chunk in enumerate(self.chunks):
-            if chunk.id == chunk_id:
-                del self.chunks[index]
-                return
+        chunk = self._chunks_by_id.get(chunk_id)
+        if chunk is not None:
+            self.remove_chunk(chunk)
 
     def add_new_chunk_and_update(self, new_chunk):
+        """
+        Add the new chunk and cut, shrink or remove the chunks it overlaps.
+
+        Returns
+        -------
+        updated_chunks : List[Chunk]
+            Chunks whose boundaries changed, including the right part of a chunk split
+            in two by the new chunk.
+        removed_chunks : List[Chunk]
+            Chunks entirely covered by the new chunk.
+        """
         start_index = new_chunk.start_index
         end_index = new_chunk.end_index
 
+        # Only the chunks in self.chunks[first:last] overlap the new chunk
+        first, last = self._overlapping_positions(start_index, end_index)
+
         chunks_to_remove = []
         updated_chunks = []
-        chunks_to_add = [new_chunk]
-        for chunk in self.chunks:
+        left_chunks = []
+        right_chunks = []
+        for chunk in self.chunks[first:last]:
             # Outer sandwich
             if chunk.start_index >= start_index and chunk.end_index <= end_index:
                 chunks_to_remove.append(chunk)
@@ -69,33 +154,61 @@ class Chunks:
                     end_index=chunk.end_index,
                     label=chunk.label,
                 )
-                chunks_to_add.append(right_chunk)
+                right_chunks.append(right_chunk)
                 updated_chunks.append(right_chunk)
 
                 chunk.update(end_index=start_index - 1)
+                left_chunks.append(chunk)
                 updated_chunks.append(chunk)
 
             # Left sandwich
             elif chunk.start_index < start_index and chunk.end_index >= start_index:
                 chunk.update(end_index=start_index - 1)
+                left_chunks.append(chunk)
                 updated_chunks.append(chunk)
 
             # Right sandwich
             elif chunk.start_index <= end_index and chunk.end_index > end_index:
                 chunk.update(start_index=end_index + 1)
+                right_chunks.append(chunk)
                 updated_chunks.append(chunk)
 
-        for chunk in chunks_to_add:
-            self.add_chunk(chunk)
+        for chunk in chunks_to_remove:
+            if self._chunks_by_id.get(chunk.id) is chunk:
+                del self._chunks_by_id[chunk.id]
+
+        for chunk in right_chunks:
+            self._chunks_by_id[chunk.id] = chunk
+        self._chunks_by_id[new_chunk.id] = new_chunk
 
-        self.remove_chunks(chunks_to_remove)
+        replacement = left_chunks + [new_chunk] + right_chunks
+        self.chunks[first:last] = replacement
+        self._starts[first:last] = [chunk.start_index for chunk in replacement]
 
         return updated_chunks, chunks_to_remove
 
     def remove_chunks(self, chunks_to_remove):
-        # TODO O(m*n) improve
-        for chunk in chunks_to_remove[::-1]:
-            self.remove_chunk_by_id(chunk.id)
+        for chunk in chunks_to_remove:
+            self.remove_chunk(chunk)
+
+    @classmethod
+    def from_spans(cls, spans, labels_size):
+        """
+        Create chunks from (start_index, end_index, label) spans, end index included.
+        """
+        chunks = cls(labels_size=labels_size)
+        chunks._reset(
+            [
+                Chunk(start_index=start_index, end_index=end_index, label=label)
+                for start_index, end_index, label in spans
+            ]
+        )
+        return chunks
+
+    def to_spans(self):
+        return [
+            (chunk.start_index, chunk.end_index, chunk.label) for chunk in self.chunks
+        ]
 
     def labels_to_chunks(self, labels):
         start_index = None
@@ -144,3 +257,337 @@ class Chunks:
                 labels[index] = "I-" + chunk.label
 
         return labels
+
+
+class SpanLabels:
+    """
+    Labels of a corpus stored as spans instead of per character IOB2 lists.
+
+    Only the chunks of every document are stored, so the memory used depends on the
+    number of chunks and not on the number of characters. The IOB2 labels of a
+    document are built when they are read.
+    """
+
+    def __init__(self, sizes, spans_list=None):
+        """
+        Parameters
+        ----------
+        sizes : List[int]
+            Number of characters of every document.
+        spans_list : List[List[Tuple[int, int, str]]], optional
+            For every document, its (start_index, end_index, label) spans, end index
+            included. By default, none of the documents are annotated.
+        """
+        self.sizes = np.asarray(sizes, dtype=np.int64)
+        if spans_list is None:
+            self.spans_list = [()] * len(self.sizes)
+        else:
+            self.spans_list = [tuple(spans) for spans in spans_list]
+
+    @classmethod
+    def from_labels(cls, labels_list):
+        return cls(
+            sizes=[len(labels) for labels in labels_list],
+            spans_list=corpus_labels_to_spans(labels_list),
+        )
+
+    def get_spans(self, index):
+        return self.spans_list[index]
+
+    def copy(self):
+        """
+        Copy of the labels. The sizes and the spans of every document (tuples) never
+        change, they are shared with the copy.
+        """
+        labels = SpanLabels.__new__(SpanLabels)
+        labels.sizes = self.sizes
+        labels.spans_list = list(self.spans_list)
+        return labels
+
+    def set_spans(self, index, spans):
+        self.spans_list[index] = tuple(spans)
+
+    def to_list(self):
+        """
+        Build the IOB2 labels of the whole corpus.
+        """
+        return corpus_spans_to_labels(self.spans_list, self.sizes)
+
+    def __len__(self):
+        return len(self.spans_list)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return corpus_spans_to_labels(self.spans_list[index], self.sizes[index])
+        return corpus_spans_to_labels([self.spans_list[index]], [self.sizes[index]])[0]
+
+    def __setitem__(self, index, labels):
+        self.spans_list[index] = tuple(corpus_labels_to_spans([labels])[0])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __eq__(self, other):
+        if isinstance(other, SpanLabels):
+            return (
+                np.array_equal(self.sizes, other.sizes)
+                and self.spans_list == other.spans_list
+            )
+        try:
+            return self.to_list() == list(other)
+        except TypeError:
+            return NotImplemented
+
+    def __repr__(self):
+        return f"SpanLabels({self.to_list()!r})"
+
+
+# -----------------------------------------------------------
+# Corpus level conversions
+# -----------------------------------------------------------
+
+
+def _offsets(sizes):
+    ends = np.cumsum(sizes)
+    return ends - sizes, ends
+
+
+class ChunkTable:
+    """
+    Chunks of a whole corpus stored column-wise in NumPy arrays.
+
+    A chunk costs a few bytes in a ChunkTable instead of a Chunk object, which makes
+    it the right container for corpora with millions of chunks. Chunk objects are
+    only created for the documents that need them (see ChunkTable.chunks).
+    """
+
+    def __init__(self, documents, start_indices, end_indices, label_codes, label_names):
+        """
+        Parameters
+        ----------
+        documents : np.ndarray
+            Index of the document of every chunk, sorted.
+        start_indices : np.ndarray
+            Start index of every chunk in its document, sorted within a document.
+        end_indices : np.ndarray
+            End index (included) of every chunk in its document.
+        label_codes : np.ndarray
+            Index of the label of every chunk in label_names.
+        label_names : List[str]
+            Names of the labels.
+        """
+        self.documents = np.asarray(documents, dtype=np.int64)
+        self.start_indices = np.asarray(start_indices, dtype=np.int64)
+        self.end_indices = np.asarray(end_indices, dtype=np.int64)
+        self.label_codes = np.asarray(label_codes, dtype=np.int32)
+        self.label_names = list(label_names)
+
+    @classmethod
+    def from_spans(cls, spans_list):
+        """
+        Create the table from the (start_index, end_index, label) spans of every
+        document.
+        """
+        label_names = {}
+        documents, start_indices, end_indices, label_codes = [], [], [], []
+        for document, spans in enumerate(spans_list):
+            for start_index, end_index, label in sorted(spans):
+                documents.append(document)
+                start_indices.append(start_index)
+                end_indices.append(end_index)
+                label_codes.append(label_names.setdefault(label, len(label_names)))
+
+        return cls(documents, start_indices, end_indices, label_codes, label_names)
+
+    @classmethod
+    def from_labels(cls, labels_list):
+        """
+        Create the table from the IOB2 labels of every document.
+
+        The labels are encoded as integers and the chunks are found with a run-length
+        detection over the whole corpus, which gives the same chunks as
+        Chunks.labels_to_chunks applied to every document.
+        """
+        sizes = np.fromiter(
+            (len(labels) for labels in labels_list),
+            dtype=np.int64,
+            count=len(labels_list),
+        )
+        total_size = int(sizes.sum())
+        if not total_size:
+            return cls([], [], [], [], [])
+
+        # Encode every label into the index of the label in the vocabulary
+        vocabulary = {}
+        codes = np.fromiter(
+            (
+                vocabulary.setdefault(label, len(vocabulary))
+                for labels in labels_list
+                for label in labels
+            ),
+            dtype=np.int64,
+            count=total_size,
+        )
+        label_names = {}
+        name_codes = np.array(
+            [label_names.setdefault(label[2:], len(label_names)) for label in vocabulary]
+        )
+        begin_codes = np.array([label[:2] == "B-" for label in vocabulary])
+
+        is_begin = begin_codes[codes]
+        names = name_codes[codes]
+
+        # A run stops before a "B-" or a change of label name, and at every new document
+        starts_of_documents, ends_of_documents = _offsets(sizes)
+        is_run_start = np.ones(total_size, dtype=bool)
+        is_run_start[1:] = is_begin[1:] | (names[1:] != names[:-1])
+        is_run_start[starts_of_documents[sizes > 0]] = True
+
+        # Only the runs starting with a "B-" are chunks
+        run_starts = np.flatnonzero(is_run_start)
+        run_ends = np.append(run_starts[1:], total_size) - 1
+        is_chunk = is_begin[run_starts]
+        start_indices = run_starts[is_chunk]
+        end_indices = run_ends[is_chunk]
+
+        # Go back to per document indices
+        documents = np.searchsorted(ends_of_documents, start_indices, side="right")
+        return cls(
+            documents,
+            start_indices - starts_of_documents[documents],
+            end_indices - starts_of_documents[documents],
+            names[start_indices],
+            label_names,
+        )
+
+    def __len__(self):
+        return len(self.documents)
+
+    @property
+    def nbytes(self):
+        return (
+            self.documents.nbytes
+            + self.start_indices.nbytes
+            + self.end_indices.nbytes
+            + self.label_codes.nbytes
+        )
+
+    def _document_slice(self, document):
+        return slice(
+            np.searchsorted(self.documents, document, side="left"),
+            np.searchsorted(self.documents, document, side="right"),
+        )
+
+    def spans(self, document):
+        """
+        Return the (start_index, end_index, label) spans of the given document.
+        """
+        document_slice = self._document_slice(document)
+        return [
+            (start_index, end_index, self.label_names[label_code])
+            for start_index, end_index, label_code in zip(
+                self.start_indices[document_slice].tolist(),
+                self.end_indices[document_slice].tolist(),
+                self.label_codes[document_slice].tolist(),
+            )
+        ]
+
+    def chunks(self, document):
+        """
+        Return the Chunk objects of the given document.
+        """
+        return [
+            Chunk(start_index=start_index, end_index=end_index, label=label)
+            for start_index, end_index, label in self.spans(document)
+        ]
+
+    def to_spans_list(self, n_documents):
+        spans_list = [[] for _ in range(n_documents)]
+        for document, start_index, end_index, label_code in zip(
+            self.documents.tolist(),
+            self.start_indices.tolist(),
+            self.end_indices.tolist(),
+            self.label_codes.tolist(),
+        ):
+            spans_list[document].append(
+                (start_index, end_index, self.label_names[label_code])
+            )
+        return spans_list
+
+    def to_labels(self, sizes):
+        """
+        Build the IOB2 labels of every document, given their number of characters.
+        The chunks of a document must not overlap.
+        """
+        sizes = np.asarray(sizes, dtype=np.int64)
+        starts_of_documents, ends_of_documents = _offsets(sizes)
+        total_size = int(sizes.sum())
+
+        # Code 0 is "O", the label i has the codes 2i + 1 for "B-" and 2i + 2 for "I-"
+        codes = np.zeros(total_size + 1, dtype=np.int64)
+        if len(self):
+            offsets = starts_of_documents[self.documents]
+            start_indices = self.start_indices + offsets
+            end_indices = self.end_indices + offsets
+
+            # Fill the inside of the chunks with a cumulative sum of their boundaries
+            inside_codes = 2 * self.label_codes.astype(np.int64) + 2
+            codes[start_indices + 1] += inside_codes
+            codes[end_indices + 1] -= inside_codes
+            codes = np.cumsum(codes)
+            codes[start_indices] = inside_codes - 1
+
+        tags = ["O"]
+        for label in self.label_names:
+            tags += ["B-" + label, "I-" + label]
+        flat_labels = np.array(tags, dtype=object)[codes[:total_size]].tolist()
+
+        return [
+            flat_labels[start:end]
+            for start, end in zip(
+                starts_of_documents.tolist(), ends_of_documents.tolist()
+            )
+        ]
+
+
+def corpus_labels_to_spans(labels_list):
+    """
+    Convert the IOB2 labels of a whole corpus into spans in one batched call.
+
+    It gives the same chunks as Chunks.labels_to_chunks applied to every document.
+
+    Parameters
+    ----------
+    labels_list : List[List[str]]
+        IOB2 labels of every document.
+
+    Returns
+    -------
+    spans_list : List[List[Tuple[int, int, str]]]
+        For every document, its (start_index, end_index, label) spans sorted by start
+        index. The end index is included, as in Chunk.
+    """
+    return ChunkTable.from_labels(labels_list).to_spans_list(len(labels_list))
+
+
+def corpus_spans_to_labels(spans_list, sizes):
+    """
+    Convert the spans of a whole corpus into IOB2 labels in one batched call.
+
+    It gives the same labels as Chunks.to_labels applied to every document.
+
+    Parameters
+    ----------
+    spans_list : List[List[Tuple[int, int, str]]]
+        For every document, its (start_index, end_index, label) spans. The end index
+        is included and the spans of a document must not overlap.
+    sizes : List[int]
+        Number of characters of every document.
+
+    Returns
+    -------
+    labels_list : List[List[str]]
+        IOB2 labels of every document.
+    """
+    return ChunkTable.from_spans(spans_list).to_labels(sizes)
@@ -1,12 +1,15 @@
-import ipywidgets
-
-from pylighter.shortcut_helper.shortcut_helper import Shortcut
+from pylighter.shortcut_helper.shortcut import Shortcut
 
 # -----------------------------------------------------------
 # Files paths
 # -----------------------------------------------------------
 
 ANNOTATION_SAVE_PATH = "annotation.csv"
+# Format of the labels in the saved csv: "iob2" writes the list of the IOB2 labels of
+# every char in a "labels" column, "spans" writes the (start, end, label) spans of
+# every document as JSON in a "spans" column, which is much smaller.
+LABELS_FORMATS = ["iob2", "spans"]
+DEFAULT_LABELS_FORMAT = "iob2"
 
 # -----------------------------------------------------------
 # Display
@@ -32,20 +35,53 @@ DEFAULT_COLORS = [
 ]
 
 ERASER_COLOR = "#ED6855"
+# "buttons" displays every char as a button, "html" displays the whole document as a
+# single HTML widget, which is much faster to render for long documents.
+RENDERERS = ["buttons", "html"]
+DEFAULT_RENDERER = "buttons"
+# Maximum number of char buttons kept to be reused by the next documents
+CHAR_BUTTONS_POOL_MAX_SIZE = 20000
+# Display the header, buttons and footer once and only swap the document on navigation
+PERSISTENT_SHELL = False
+
 CHAR_PARAMS = {
     "min_width_between_chars": "4px",
     "width_white_space": "10px",
     "font_size": "medium",
 }
 
+# Widgets of the additional outputs, by name of their ipywidgets class so that the
+# config does not import ipywidgets
 DISPLAY_ELEMENTS = {
-    "checkbox": ipywidgets.Checkbox,
-    "int_text": ipywidgets.IntText,
-    "float_text": ipywidgets.FloatText,
-    "text": ipywidgets.Text,
-    "text_area": ipywidgets.Textarea,
+    "checkbox": "Checkbox",
+    "int_text": "IntText",
+    "float_text": "FloatText",
+    "text": "Text",
+    "text_area": "Textarea",
 }
 
+# -----------------------------------------------------------
+# Preloading
+# -----------------------------------------------------------
+
+# Number of documents preloaded after and before the current one
+PRELOAD_AHEAD = 1
+PRELOAD_BEHIND = 1
+# Budget of the preloaded displays kept in memory (None for no limit)
+MAX_PRELOADED_DOCUMENTS = 6
+MAX_PRELOADED_CHARS = 50000
+# Number of threads preloading documents in the background
+PRELOAD_WORKERS = 2
+
+# -----------------------------------------------------------
+# Autosave
+# -----------------------------------------------------------
+
+# Seconds between two autosaves, and number of changes of document between two
+# autosaves (None to disable)
+AUTOSAVE_INTERVAL = None
+AUTOSAVE_EVERY = None
+
 # -----------------------------------------------------------
 # Shortcuts
 # -----------------------------------------------------------
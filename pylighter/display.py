@@ -1,7 +1,14 @@
+import collections
 import functools
+import html
+import itertools
+import threading
 
+import ipywidgets
 from IPython.display import Javascript, display
-from ipywidgets import HTML, BoundedIntText, Button, GridBox, HBox, Layout, Output, VBox
+from ipywidgets import (HTML, BoundedIntText, Box, Button, GridBox, HBox, Layout, Output,
+                        Text, VBox, Widget)
+from ipywidgets.widgets import widget as widget_module
 
 from pylighter import config, utils
 
@@ -35,6 +42,7 @@ def display_header(current_index, corpus_size, move_to_function, df_additional_i
     vbox.add_class("card")
     vbox.add_class("card_header")
     display(vbox)
+    return vbox
 
 
 def instantiate_title(current_index, corpus_size, move_to_function):
@@ -55,14 +63,15 @@ def instantiate_title(current_index, corpus_size, move_to_function):
     document_number_input.add_class("document_number_input")
 
     # Add observer to the input area in order to move to any document
-    document_number_input.observe(
-        functools.partial(
-            document_number_observer,
-            current_index=current_index,
-            move_function=move_to_function,
-        ),
-        "value",
-    )
+    if move_to_function is not None:
+        document_number_input.observe(
+            functools.partial(
+                document_number_observer,
+                current_index=current_index,
+                move_function=move_to_function,
+            ),
+            "value",
+        )
     corpus_size_html = HTML(f"<h4><b>/ {corpus_size-1}</b></h4>")
 
     return HBox(
@@ -87,16 +96,30 @@ def instantiate_additional_infos(current_index, df_additional_infos):
     subtitle_html = []
 
     for name in names:
-        subtitle_html.append(HTML(f"{name}:&nbsp;<b>{str(additional_infos[name])}</b>"))
+        subtitle_html.append(HTML(additional_info_html(name, additional_infos[name])))
 
     return HBox(subtitle_html, layout=subtitle_layout)
 
 
+def additional_info_html(name, value):
+    return f"{name}:&nbsp;<b>{str(value)}</b>"
+
+
 @out.capture()
 def display_top_buttons(move_function, clear_function, shortcuts_displays_helpers={}):
     """
     Display the previous, next and skip buttons. Link them to any shortcuts if given.
     """
+    hbox = instantiate_top_buttons(
+        move_function, clear_function, shortcuts_displays_helpers
+    )
+    display(hbox)
+    return hbox
+
+
+def instantiate_top_buttons(
+    move_function, clear_function, shortcuts_displays_helpers={}
+):
     # Create buttons
     previous_button = Button(
         description="Previous", button_style="info", icon="chevron-left"
@@ -132,7 +155,7 @@ def display_top_buttons(move_function, clear_function, shortcuts_displays_helper
         layout=Layout(display="flex", flex_flow="row", justify_content="space-between"),
     )
     hbox.add_class("move_buttons_margin")
-    display(hbox)
+    return hbox
 
 
 @out.capture()
@@ -140,10 +163,14 @@ def display_core(instantiated_core):
     display(instantiated_core)
 
 
-def preload_core(obj, **kwargs):
-    core_display, char_buttons, labels_buttons = instantiate_core(**kwargs)
+def preload_core(obj, renderer="buttons", **kwargs):
+    core_display, document_chars, labels_buttons, chunk_area = instantiate_core(
+        renderer=renderer, **kwargs
+    )
     obj["core_display"] = core_display
-    obj["char_buttons"] = char_buttons
+    obj["chunk_area"] = chunk_area
+    obj["char_buttons"] = document_chars if renderer == "buttons" else None
+    obj["html_document"] = document_chars if renderer == "html" else None
     obj["labels_buttons"] = labels_buttons
 
 
@@ -155,12 +182,19 @@ def instantiate_core(
     selected_labeliser,
     shortcuts_displays_helpers,
     label_on_click,
+    renderer="buttons",
+    window_size=None,
+    window_on_move=None,
+    labels_colors=None,
 ):
     """
     Instantiate the core elements (ie, the toolbox, the document and the chunk area).
+    With the "buttons" renderer, the document chars are returned as a list of buttons
+    (or a CharWindow if the document is longer than window_size). With the "html"
+    renderer, they are returned as an HTMLDocument. The ChunkArea holding the tags of
+    the chunks is returned last.
     """
-
-    document_display, char_buttons, labels_buttons = instantiate_document(
+    document_args = (
         document,
         char_params,
         char_on_click,
@@ -169,7 +203,15 @@ def instantiate_core(
         shortcuts_displays_helpers,
         label_on_click,
     )
-    chunks_area_display = instantiate_chunks_area(labels_names)
+    if renderer == "html":
+        document_display, document_chars, labels_buttons = instantiate_html_document(
+            *document_args, labels_colors=labels_colors
+        )
+    else:
+        document_display, document_chars, labels_buttons = instantiate_document(
+            *document_args, window_size=window_size, window_on_move=window_on_move
+        )
+    chunks_area_display, chunk_area = instantiate_chunks_area(labels_names)
 
     core_display = GridBox(
         children=[document_display, chunks_area_display],
@@ -179,7 +221,7 @@ def instantiate_core(
         ),
     )
 
-    return core_display, char_buttons, labels_buttons
+    return core_display, document_chars, labels_buttons, chunk_area
 
 
 def instantiate_toolbox(
@@ -228,78 +270,427 @@ def instantiate_document(
     selected_labeliser,
     shortcuts_displays_helpers,
     label_on_click,
+    window_size=None,
+    window_on_move=None,
 ):
     """
     Instantiate the document display.
-    A document composed of n chars is displayed as n buttons.
+    A document composed of n chars is displayed as n buttons. If window_size is given
+    and the document is longer, only a window of about window_size chars is displayed
+    at a time (see CharWindow).
     """
-    buttons = [None] * len(document)
-    buttons_display = []
-    current_word = []
+    if window_size and len(document) > window_size:
+        char_buttons = CharWindow(
+            document, char_params, char_on_click, window_size, on_move=window_on_move
+        )
+        chars_display = char_buttons.display
+    else:
+        layouts = char_layouts(char_params)
+        char_buttons = [
+            instantiate_char_button(
+                char,
+                char_params,
+                functools.partial(char_on_click, char_index=char_index),
+                layouts,
+            )
+            for char_index, char in enumerate(document)
+        ]
+        chars_display = HBox(
+            group_by_words(char_buttons, document),
+            layout=Layout(
+                display="flex",
+                flex_flow="row wrap",
+            ),
+        )
+
+    # Create the global display
+    toolbox_display, labels_buttons = instantiate_toolbox(
+        labels_names, selected_labeliser, shortcuts_displays_helpers, label_on_click
+    )
+    divider = HTML("<hr style='margin-top:0.5em;margin-bottom:0.5em'>")
+    document_display = VBox(
+        [toolbox_display, divider, chars_display],
+    )
+    document_display.add_class("card")
 
-    char_layout = Layout(min_width=char_params["min_width_between_chars"])
-    space_layout = Layout(min_width=char_params["width_white_space"])
+    return document_display, char_buttons, labels_buttons
+
+
+_char_layouts = {}
+
+
+def char_layouts(char_params):
+    """
+    Layouts of the chars and of the spaces. They are shared by all the char buttons
+    with the same char_params, which can therefore be reused without leaking layouts.
+    """
+    key = (char_params["min_width_between_chars"], char_params["width_white_space"])
+    if key not in _char_layouts:
+        _char_layouts[key] = (
+            Layout(min_width=char_params["min_width_between_chars"]),
+            Layout(min_width=char_params["width_white_space"]),
+        )
+    return _char_layouts[key]
+
+
+class CharButtonsPool:
+    """
+    Char buttons released by the documents that are not displayed anymore, to be
+    reused by the next documents instead of creating new widgets.
+    """
+
+    def __init__(self, max_size=config.CHAR_BUTTONS_POOL_MAX_SIZE):
+        self.max_size = max_size
+        self.buttons = []
+        # Documents are preloaded in other threads
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.buttons)
+
+    def take(self):
+        with self.lock:
+            if self.buttons:
+                return self.buttons.pop()
+        return None
+
+    def release(self, buttons):
+        """
+        Give back buttons to the pool. The buttons that do not fit in the pool are
+        closed.
+        """
+        buttons = list(buttons)
+        with self.lock:
+            kept = max(min(len(buttons), self.max_size - len(self.buttons)), 0)
+            self.buttons.extend(buttons[:kept])
+        for button in buttons[kept:]:
+            button.close()
+
+
+char_buttons_pool = CharButtonsPool()
+
+
+def on_char_button_click(button):
+    # The handler of a char button changes every time the button is reused
+    button.char_on_click(button)
+
+
+def reset_char_button(button, char, layout):
+    with button.hold_sync():
+        button.description = char
+        button.layout = layout
+        button._dom_classes = ("char_display",)
+
+
+def instantiate_char_button(char, char_params, on_click, layouts=None):
+    """
+    Return a button for the given char, reused from the pool if possible.
+    """
+    char_layout, space_layout = layouts or char_layouts(char_params)
+    layout = space_layout if char == " " else char_layout
+
+    button = char_buttons_pool.take()
+    if button is None:
+        # Set the style and class at creation, they are sent with the widget
+        button = Button(
+            description=char,
+            layout=layout,
+            style={"button_color": "transparent"},
+            _dom_classes=("char_display",),
+        )
+        button.on_click(on_char_button_click)
+    else:
+        reset_char_button(button, char, layout)
+
+    button.char_on_click = on_click
+    return button
 
-    # Create the correct button associated to each char
-    for char_index, char in enumerate(document):
-        # Create buton
-        button_layout = char_layout
-        if char == " ":
-            button_layout = space_layout
-        button = Button(description=char, layout=button_layout)
 
-        button.style.button_color = "transparent"
-        button.add_class("char_display")
-        button.on_click(functools.partial(char_on_click, char_index=char_index))
+def release_core(preloaded):
+    """
+    Give back the char buttons of a preloaded core to the pool and close all its
+    other widgets.
+    """
+    char_buttons = preloaded.get("char_buttons") or []
+    if isinstance(char_buttons, CharWindow):
+        char_buttons = char_buttons.buttons
+    char_buttons_pool.release(char_buttons)
+
+    if preloaded.get("core_display") is not None:
+        close_widgets(preloaded["core_display"], keep=char_buttons)
+
 
-        # Differentiate chars from spaces to have a good word wrap
+def group_by_words(char_buttons, chars):
+    """
+    Group the chars buttons into one HBox per word (the space included) to have a good
+    word wrap.
+    """
+    words_displays = []
+    current_word = []
+    for button, char in zip(char_buttons, chars):
+        current_word.append(button)
         if char == " ":
-            current_word.append(button)
-            buttons_display.append(HBox(current_word))
+            words_displays.append(HBox(current_word))
             current_word = []
-        else:
-            current_word.append(button)
-        buttons[char_index] = button
 
     if current_word:
-        buttons_display.append(HBox(current_word))
+        words_displays.append(HBox(current_word))
+
+    return words_displays
+
+
+def compute_window_starts(document, window_size):
+    """
+    Split the document into windows of at most window_size chars, cut after a space
+    when possible. Returns the start index of every window.
+    """
+    window_starts = [0]
+    while len(document) - window_starts[-1] > window_size:
+        window_start = window_starts[-1]
+        window_end = document.rfind(" ", window_start, window_start + window_size) + 1
+        if window_end <= window_start:
+            window_end = window_start + window_size
+        window_starts.append(window_end)
+    return window_starts
+
+
+class CharWindow:
+    """
+    Chars buttons of a long document, built only for the visible window.
+
+    Iterating and len only cover the buttons of the visible chars, while indexing
+    uses global char indices: slicing returns the buttons of the visible chars in
+    the slice, so that highlights can be applied with the indices of the chunks.
+    Moving to another window reuses the same buttons.
+    """
+
+    def __init__(self, document, char_params, char_on_click, window_size, on_move=None):
+        self.document = document
+        self.char_params = char_params
+        self.char_on_click = char_on_click
+        self.on_move = on_move
+        self.layouts = char_layouts(char_params)
+
+        self.window_starts = compute_window_starts(document, window_size)
+        self.window_index = 0
+        self.buttons = []
+        self.window_start = 0
+        self.window_end = 0
+
+        self.chars_box = HBox([], layout=Layout(display="flex", flex_flow="row wrap"))
+        self.previous_button = Button(icon="chevron-left", layout=Layout(width="40px"))
+        self.previous_button.on_click(functools.partial(self.move, direction=-1))
+        self.next_button = Button(icon="chevron-right", layout=Layout(width="40px"))
+        self.next_button.on_click(functools.partial(self.move, direction=1))
+        self.position_html = HTML()
+        self.display = VBox(
+            [
+                self.chars_box,
+                HBox(
+                    [self.previous_button, self.position_html, self.next_button],
+                    layout=Layout(
+                        display="flex", flex_flow="row", justify_content="center"
+                    ),
+                ),
+            ]
+        )
+
+        self._build()
+
+    def __len__(self):
+        return self.window_end - self.window_start
+
+    def __iter__(self):
+        return iter(self.buttons[: len(self)])
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, _ = key.indices(len(self.document))
+            start = max(start, self.window_start) - self.window_start
+            stop = min(stop, self.window_end) - self.window_start
+            return self.buttons[start:stop] if start < stop else []
+
+        if key < 0:
+            key += len(self.document)
+        if not self.window_start <= key < self.window_end:
+            raise IndexError(f"char {key} is not in the visible window")
+        return self.buttons[key - self.window_start]
+
+    def _on_char_click(self, button, position):
+        self.char_on_click(button, char_index=self.window_start + position)
+
+    def _build(self):
+        """
+        Display the chars of the current window, recycling the existing buttons.
+        """
+        self.window_start = self.window_starts[self.window_index]
+        if self.window_index + 1 < len(self.window_starts):
+            self.window_end = self.window_starts[self.window_index + 1]
+        else:
+            self.window_end = len(self.document)
+        chars = self.document[self.window_start : self.window_end]  # noqa
+
+        char_layout, space_layout = self.layouts
+        for position, char in enumerate(chars):
+            if position < len(self.buttons):
+                reset_char_button(
+                    self.buttons[position],
+                    char,
+                    space_layout if char == " " else char_layout,
+                )
+            else:
+                self.buttons.append(
+                    instantiate_char_button(
+                        char,
+                        self.char_params,
+                        functools.partial(self._on_char_click, position=position),
+                        self.layouts,
+                    )
+                )
+
+        for words_display in self.chars_box.children:
+            close_widgets(words_display, keep=self.buttons)
+        self.chars_box.children = group_by_words(self.buttons, chars)
+
+        self.position_html.value = (
+            f"<p style='margin:auto 1em'>{self.window_start}-{self.window_end - 1}"
+            f" / {len(self.document) - 1}</p>"
+        )
+        self.previous_button.disabled = self.window_index == 0
+        self.next_button.disabled = self.window_index == len(self.window_starts) - 1
+
+    def move(self, button=None, direction=1):
+        window_index = min(
+            max(self.window_index + direction, 0), len(self.window_starts) - 1
+        )
+        if window_index == self.window_index:
+            return
+
+        self.window_index = window_index
+        self._build()
+        if self.on_move:
+            self.on_move(self)
+
+
+class HTMLDocument:
+    """
+    Document displayed as one HTML widget with one span per char.
+
+    Clicks are caught by a single listener in the page (see js/click_delegation.js)
+    that writes the index of the clicked char in a hidden input, so a click is one
+    message whatever the size of the document. Highlights are one style element built
+    from the spans of the chunks, scoped to the document by a class of its own.
+    """
+
+    # Ids of the documents, for the class scoping their highlights
+    _ids = itertools.count()
+
+    def __init__(self, document, char_on_click, labels_colors=None):
+        """
+        Parameters
+        ----------
+        labels_colors : List[utils.LabelColor], optional
+            Colors of the highlights of every label. Labels without colors are not
+            highlighted.
+        """
+        chars_html = "".join(
+            f'<span class="html_document_char" data-index="{char_index}">'
+            f"{html.escape(char)}</span>"
+            for char_index, char in enumerate(document)
+        )
+        self.text = HTML(f'<div class="html_document">{chars_html}</div>')
+        self.class_name = f"html_document_{next(self._ids)}"
+        self.text.add_class(self.class_name)
+        self.labels_colors = {
+            label_color.name: label_color for label_color in labels_colors or []
+        }
+
+        self.highlights = HTML("")
+        self.highlights.add_class("invisible")
+        self.spans = []
+
+        self.click_input = Text(value="", continuous_update=False)
+        self.click_input.add_class("html_document_click_input")
+        self.click_input.add_class("invisible")
+        self.click_input.observe(
+            functools.partial(self._on_click_input, char_on_click=char_on_click),
+            "value",
+        )
+
+    @staticmethod
+    def _on_click_input(change, char_on_click):
+        # Values are "char_index:timestamp" so that clicking twice the same char
+        # still changes the value
+        if change.new:
+            char_on_click(None, char_index=int(change.new.split(":")[0]))
+
+    def highlight(self, spans):
+        """
+        Highlight the given (start_index, end_index, label) spans, end index included.
+        Chars outside of the spans are not highlighted.
+        """
+        spans = list(spans)
+        if spans == self.spans:
+            return
+
+        css_rules = ""
+        for start_index, end_index, label in spans:
+            label_color = self.labels_colors.get(label)
+            if label_color is None:
+                continue
+            css_rules += (
+                f".{self.class_name} .html_document > span:nth-child(n+{start_index + 1})"
+                f":nth-child(-n+{end_index + 1}) {{"
+                f"background-color: {label_color.background_color} !important;"
+                f"color: {label_color.text_color} !important;}}"
+            )
+        self.highlights.value = f"<style>{css_rules}</style>"
+        self.spans = spans
+
+
+def instantiate_html_document(
+    document,
+    char_params,
+    char_on_click,
+    labels_names,
+    selected_labeliser,
+    shortcuts_displays_helpers,
+    label_on_click,
+    labels_colors=None,
+):
+    """
+    Instantiate the document display.
+    A document is displayed as a single HTML widget, whatever its number of chars.
+    """
+    html_document = HTMLDocument(document, char_on_click, labels_colors)
 
-    # Create the global display
     toolbox_display, labels_buttons = instantiate_toolbox(
         labels_names, selected_labeliser, shortcuts_displays_helpers, label_on_click
     )
     divider = HTML("<hr style='margin-top:0.5em;margin-bottom:0.5em'>")
-    hbox = HBox(
-        buttons_display,
-        layout=Layout(
-            display="flex",
-            flex_flow="row wrap",
-        ),
-    )
     document_display = VBox(
-        [toolbox_display, divider, hbox],
+        [
+            toolbox_display,
+            divider,
+            html_document.text,
+            html_document.highlights,
+            html_document.click_input,
+        ],
     )
     document_display.add_class("card")
+    document_display.add_class("html_document_card")
 
-    return document_display, buttons, labels_buttons
+    return document_display, html_document, labels_buttons
 
 
 def instantiate_chunks_area(labels_names):
     """
-    Instantiate the ipywidgets elements that will be used to display chunks.
+    Instantiate the ipywidgets elements that will be used to display chunks. Return
+    the chunk area display and the ChunkArea holding the tags of the chunks.
     """
-    chunks_box = HBox(
-        [],
-        layout=Layout(
-            display="flex",
-            flex_flow="row wrap",
-            height="fit-content",
-            width="1OO%",
-        ),
-    )
-    chunks_box.add_class("id_class_hbox_label")
+    chunk_area = ChunkArea()
     chunk_area_display = HBox(
-        [chunks_box],
+        [chunk_area.box],
         layout=Layout(
             width="1OO%",
             height="auto",
@@ -307,19 +698,99 @@ def instantiate_chunks_area(labels_names):
     )
     chunk_area_display.add_class("card")
 
-    return chunk_area_display
+    return chunk_area_display, chunk_area
 
 
-@out.capture()
-def display_chunk(chunk, chunk_text, delete_chunk_on_click):
+class ChunkArea:
     """
-    Display the given chunk with the given text in the chunk area (next to the last one).
+    Tags of the chunks of a document, keyed by chunk id.
+
+    The tags are the children of a box managed by the kernel: adding, updating or
+    removing a tag is a dict operation and a single update of the box, no element is
+    looked for in the page.
+    """
+
+    def __init__(self):
+        self.box = HBox(
+            [],
+            layout=Layout(
+                display="flex",
+                flex_flow="row wrap",
+                height="fit-content",
+                width="1OO%",
+            ),
+        )
+        self.tags = {}
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __contains__(self, chunk):
+        return chunk.id in self.tags
+
+    def add(self, chunk, chunk_text, delete_chunk_on_click):
+        """
+        Add the tag of the given chunk next to the last one.
+        """
+        self.tags[chunk.id] = instantiate_chunk_tag(
+            chunk, chunk_text, delete_chunk_on_click
+        )
+        self._sync()
+
+    def set_chunks(self, chunks_texts, delete_chunk_on_click):
+        """
+        Replace all the tags by the ones of the given (chunk, chunk_text), in a single
+        update.
+        """
+        self.clear(sync=False)
+        for chunk, chunk_text in chunks_texts:
+            self.tags[chunk.id] = instantiate_chunk_tag(
+                chunk, chunk_text, delete_chunk_on_click
+            )
+        self._sync()
+
+    def update(self, chunk, chunk_text, delete_chunk_on_click):
+        """
+        Update the text of the tag of the given chunk, add it if it has no tag.
+        """
+        tag = self.tags.get(chunk.id)
+        if tag is None:
+            self.add(chunk, chunk_text, delete_chunk_on_click)
+        else:
+            tag.children[0].value = utils.chunk_html_display(chunk_text)
+
+    def remove(self, chunk):
+        """
+        Remove and close the tag of the given chunk, if any.
+        """
+        tag = self.tags.pop(chunk.id, None)
+        if tag is not None:
+            self._sync()
+            close_widgets(tag)
+
+    def clear(self, sync=True):
+        """
+        Remove and close all the tags.
+        """
+        tags = list(self.tags.values())
+        self.tags = {}
+        if sync:
+            self._sync()
+        for tag in tags:
+            close_widgets(tag)
+
+    def _sync(self):
+        self.box.children = tuple(self.tags.values())
+
+
+def instantiate_chunk_tag(chunk, chunk_text, delete_chunk_on_click):
+    """
+    Instantiate the tag of the given chunk, with its text and its delete button.
     """
     # Create HTML equivalent of the chunk text
     text = HTML(utils.chunk_html_display(chunk_text), layout=Layout(height="10px"))
     text.add_class("chunk_text_size")
     text.add_class(f"{chunk.label}_color")
-    chunk.text_display = text
 
     # Create the delete button to delete the chunk
     delete_button = Button(
@@ -335,34 +806,34 @@ def display_chunk(chunk, chunk_text, delete_chunk_on_click):
     )
     chunk_display.add_class(f"{chunk.label}_color")
     chunk_display.add_class("chunk_tag")
-
-    # Add class id to recognize it
-    chunk_display.add_class(chunk.display_id)
-
-    # Display chunk_display then move it to the correct spot
-    chunk_display.add_class("invisible")
-    display(chunk_display)
-    display(Javascript(utils.js_add_el_to_div(chunk.display_id, "id_class_hbox_label")))
-    chunk_display.remove_class("invisible")
+    return chunk_display
 
 
 @out.capture()
 def display_additional_outputs(additional_outputs_elements, additional_outputs_values):
+    input_elements, additional_outputs_area = instantiate_additional_outputs(
+        additional_outputs_elements, additional_outputs_values
+    )
+    display(additional_outputs_area)
+    return input_elements, additional_outputs_area
+
+
+def instantiate_additional_outputs(
+    additional_outputs_elements, additional_outputs_values
+):
     hbox_elements = ["checkbox"]
 
     # Create elements
     elements_to_display = []
     input_elements = []
     for element in additional_outputs_elements:
-        value = element.default_value
-        if additional_outputs_values.notna()[element.name]:
-            value = additional_outputs_values[element.name]
+        value = additional_output_value(element, additional_outputs_values)
 
         description_element = HTML(
             f"<b style='font-size:1.1em'>{element.description}</b>",
             layout=Layout(margin="auto 0px auto 0px"),
         )
-        input_element = config.DISPLAY_ELEMENTS[element.display_type](value=value)
+        input_element = display_element_class(element.display_type)(value=value)
         if element.display_type in hbox_elements:
             # Remove indentation
             input_element.indent = False
@@ -383,8 +854,28 @@ def display_additional_outputs(additional_outputs_elements, additional_outputs_v
         ),
     )
     additional_outputs_area.add_class("card")
-    display(additional_outputs_area)
-    return input_elements
+    return input_elements, additional_outputs_area
+
+
+def display_element_class(display_type):
+    """
+    The widget class of an additional output, config.DISPLAY_ELEMENTS holds either the
+    class or the name of an ipywidgets class.
+    """
+    element_class = config.DISPLAY_ELEMENTS[display_type]
+    if isinstance(element_class, str):
+        element_class = getattr(ipywidgets, element_class)
+    return element_class
+
+
+def additional_output_value(element, additional_outputs_values):
+    """
+    Value of the given additional output element for a document, its default value if
+    the document has none.
+    """
+    if additional_outputs_values.notna()[element.name]:
+        return additional_outputs_values[element.name]
+    return element.default_value
 
 
 @out.capture()
@@ -392,6 +883,12 @@ def display_footer(save_function, quit_function, shortcuts_displays_helpers):
     """
     Display the footer of the annotation. It is composed of the quit and the save buttons.
     """
+    hbox = instantiate_footer(save_function, quit_function, shortcuts_displays_helpers)
+    display(hbox)
+    return hbox
+
+
+def instantiate_footer(save_function, quit_function, shortcuts_displays_helpers):
     # Create buttons
     quit_button = Button(description="Quit", button_style="danger", icon="sign-out")
     quit_button.on_click(quit_function)
@@ -411,7 +908,128 @@ def display_footer(save_function, quit_function, shortcuts_displays_helpers):
         layout=Layout(display="flex", flex_flow="row", justify_content="space-between"),
     )
     hbox.add_class("footer_margin")
-    display(hbox)
+    return hbox
+
+
+class Shell:
+    """
+    Static frame of the annotation (header, buttons, additional outputs and footer)
+    displayed once per session. Changing document only swaps the core display, the
+    index of the header and the values of the additional infos and outputs.
+    """
+
+    def __init__(
+        self,
+        current_index,
+        corpus_size,
+        move_function,
+        clear_function,
+        save_function,
+        quit_function,
+        shortcuts_displays_helpers,
+        df_additional_infos=None,
+        additional_outputs_elements=None,
+        additional_outputs_values=None,
+    ):
+        self.current_index = current_index
+        self.move_function = move_function
+        self.df_additional_infos = df_additional_infos
+        self.additional_outputs_elements = additional_outputs_elements
+        self._updating = False
+
+        # Header
+        title = instantiate_title(current_index, corpus_size, None)
+        self.document_number_input = title.children[1]
+        self.document_number_input.observe(self._on_document_number, "value")
+        header_display = [title]
+        self.additional_infos_display = None
+        if df_additional_infos is not None:
+            self.additional_infos_display = instantiate_additional_infos(
+                current_index, df_additional_infos
+            )
+            header_display.append(self.additional_infos_display)
+        header = VBox(header_display)
+        header.add_class("card")
+        header.add_class("card_header")
+
+        # Slot for the core display of the current document
+        self.core_box = Box([], layout=Layout(width="100%"))
+
+        children = [
+            header,
+            instantiate_top_buttons(
+                move_function, clear_function, shortcuts_displays_helpers
+            ),
+            self.core_box,
+        ]
+
+        self.additional_outputs_inputs = None
+        if additional_outputs_elements:
+            (
+                self.additional_outputs_inputs,
+                additional_outputs_area,
+            ) = instantiate_additional_outputs(
+                additional_outputs_elements, additional_outputs_values
+            )
+            children.append(additional_outputs_area)
+
+        children.append(
+            instantiate_footer(save_function, quit_function, shortcuts_displays_helpers)
+        )
+        self.box = VBox(children)
+
+    def _on_document_number(self, change):
+        if not self._updating:
+            self.move_function(button=None, direction=change.new - self.current_index)
+
+    def show_document(self, current_index, core_display, additional_outputs_values=None):
+        """
+        Show the given document in the shell. additional_outputs_values are the values
+        of the additional outputs of the document.
+        """
+        self.current_index = current_index
+        self._updating = True
+        try:
+            self.document_number_input.value = current_index
+        finally:
+            self._updating = False
+
+        if self.additional_infos_display is not None:
+            additional_infos = self.df_additional_infos.iloc[current_index]
+            for info_display, name in zip(
+                self.additional_infos_display.children, additional_infos.keys()
+            ):
+                info_display.value = additional_info_html(name, additional_infos[name])
+
+        if self.additional_outputs_inputs is not None:
+            for input_element, element in zip(
+                self.additional_outputs_inputs, self.additional_outputs_elements
+            ):
+                input_element.value = additional_output_value(
+                    element, additional_outputs_values
+                )
+
+        self.core_box.children = (core_display,)
+
+    def close(self):
+        """
+        Close the widgets of the shell, except the core display which is preloaded.
+        """
+        self.core_box.children = ()
+        close_widgets(self.box)
+
+
+@out.capture()
+def display_shell(labels_colors, char_params, **kwargs):
+    """
+    Display the shell of the annotation with its styles and toast, see Shell for the
+    arguments.
+    """
+    define_custom_styles(labels_colors, char_params)
+    shell = Shell(**kwargs)
+    display(shell.box)
+    prepare_toast()
+    return shell
 
 
 @out.capture()
@@ -443,30 +1061,51 @@ def clear_display():
 
 
 def highlight_chars(char_buttons, selected_labeliser, labels_names, undo):
+    """
+    Color the given chars with the selected label, or remove their color if undo is
+    True (or if the selected label is the eraser).
+    """
+    label_class = None
+    if not undo and selected_labeliser is not None:
+        label_class = f"{selected_labeliser}_color"
+
+    labels_classes = {f"{label}_color" for label in labels_names}
     for char_button in char_buttons:
-        # For overlap, remove all previous color
-        for label in labels_names:
-            if label != selected_labeliser:
-                char_button.remove_class(f"{label}_color")
-
-        # Add the appropriate color the char
-        if not undo:
-            char_button.add_class(f"{selected_labeliser}_color")
-        else:
-            char_button.remove_class(f"{selected_labeliser}_color")
+        set_label_class(char_button, label_class, labels_classes)
 
 
-@out.capture()
-def remove_chunk(chunk):
-    if chunk.display_id:
-        display(Javascript(utils.js_remove_el(chunk.display_id)))
+def highlight_spans(char_buttons, spans, labels_names, offset=0):
+    """
+    Color the given chars with the labels of the spans (start_index, end_index, label)
+    of the document, and remove the color of the chars outside the spans. offset is
+    the index in the document of the first char button.
+    """
+    labels_classes = {f"{label}_color" for label in labels_names}
+    chars_classes = [None] * len(char_buttons)
+    for start_index, end_index, label in spans:
+        start = max(start_index - offset, 0)
+        end = min(end_index + 1 - offset, len(char_buttons))
+        if start < end:
+            chars_classes[start:end] = [f"{label}_color"] * (end - start)
 
+    for char_button, label_class in zip(char_buttons, chars_classes):
+        set_label_class(char_button, label_class, labels_classes)
 
-def update_chunk_text(new_text, chunk, delete_chunk_on_click):
-    if chunk.text_display:
-        chunk.text_display.value = utils.chunk_html_display(new_text)
-    else:
-        display_chunk(chunk, new_text, delete_chunk_on_click)
+
+def set_label_class(char_button, label_class, labels_classes):
+    """
+    Replace the label classes of the char button by label_class (if not None). The
+    classes are only sent to the front end if they changed, in a single message.
+    """
+    classes = [
+        class_name
+        for class_name in char_button._dom_classes
+        if class_name not in labels_classes
+    ]
+    if label_class is not None:
+        classes.append(label_class)
+    if classes != list(char_button._dom_classes):
+        char_button._dom_classes = classes
 
 
 def add_shortcut_to(button, name, shortcuts_displays_helpers):
@@ -477,45 +1116,65 @@ def add_shortcut_to(button, name, shortcuts_displays_helpers):
     return button
 
 
-@out.capture()
-def prepare_toast():
-    # Remove toast if already exists
-    display(
-        Javascript(
-            """let snackbar = document.getElementById('snackbar')
-                if (snackbar) {
-                    snackbar.remove()
-                }"""
-        )
+def toast_widget():
+    """
+    The HTML widget showing the toasts, kept for the session. It only holds the
+    styles of the toast until a toast is shown.
+    """
+    return cached_html(
+        "toast", lambda: f"<style>{utils.text_parser('toast/toast.css')}</style>"
     )
 
-    # Load css and html
-    css = utils.text_parser("toast/toast.css")
-    html = utils.text_parser(
-        "toast/toast.html",
-    )
 
-    # Display css and HTML
-    display(HTML(f"<style>{css}</style>{html}"))
+@out.capture()
+def prepare_toast():
+    toast = toast_widget()
+    display(toast)
+    return toast
 
-    # Append element to body so that the toast is on top
-    display(
-        Javascript("document.body.appendChild(document.getElementById('snackbar'))")
-    )
+
+# Makes every toast a new value of the toast widget, even with the same message
+toast_ids = itertools.count()
 
 
-@out.capture()
 def show_toast(msg, success):
-    js = utils.text_parser(
-        "toast/toast.js",
-        success_type="success" if success else "error",
-        toast_msg=msg,
+    """
+    Show a toast by setting the value of the toast widget: a widget update can be
+    sent from any thread (autosave), unlike outputs captured in out.
+    """
+    toast_widget().value = f"<style>{utils.text_parser('toast/toast.css')}</style>" + (
+        utils.text_parser(
+            "toast/toast.html",
+            toast_id=str(next(toast_ids)),
+            success_type="success" if success else "error",
+            toast_msg=html.escape(msg),
+        )
     )
-    display(Javascript(js))
 
 
 @out.capture()
 def define_custom_styles(labels_colors, char_params):
+    """
+    Display the styles of the annotation. The styles are rendered once per labels
+    colors and char params, displaying them again reuses the same widget.
+    """
+    key = (
+        "styles",
+        tuple(
+            (label_color.name, label_color.text_color, label_color.background_color)
+            for label_color in labels_colors
+        ),
+        tuple(sorted(char_params.items())),
+    )
+    styles = cached_html(
+        key,
+        lambda: f"<style>{render_custom_styles(labels_colors, char_params)}</style>",
+    )
+    display(styles)
+    return styles
+
+
+def render_custom_styles(labels_colors, char_params):
     # Define colors for labels
     css_colors = ""
     for label_color in labels_colors:
@@ -540,12 +1199,28 @@ def define_custom_styles(labels_colors, char_params):
     )
 
     # Define global style
-    css_styles = utils.text_parser(
+    return utils.text_parser(
         "css/style.css",
         char_font_size=char_params["font_size"],
         colors=css_colors,
     )
-    display(HTML(f"<style>{css_styles}</style>"))
+
+
+# HTML widgets of the styles and of the toast, kept for the session
+html_assets = {}
+
+
+def cached_html(key, render):
+    """
+    Return the HTML widget cached under the given key, built with the value returned
+    by render if it is not cached yet (or was closed). Displaying it again does not
+    send its content to the front end again.
+    """
+    widget = html_assets.get(key)
+    if widget is None or widget.comm is None:
+        widget = HTML(render())
+        html_assets[key] = widget
+    return widget
 
 
 @out.capture()
@@ -573,6 +1248,11 @@ def define_keyboard_shortcuts(shortcuts, shortcuts_class_names):
     display(Javascript(js_keyboard_listeners))
 
 
+@out.capture()
+def define_click_delegation():
+    display(Javascript(utils.text_parser("js/click_delegation.js")))
+
+
 @out.capture()
 def display_loader():
     loader = HTML(utils.text_parser("loader.html"))
@@ -581,4 +1261,62 @@ def display_loader():
 
 
 def remove_loader(loader):
-    loader.close()
+    close_widgets(loader)
+
+
+# -----------------------------------------------------------
+# Widgets lifecycle
+# -----------------------------------------------------------
+
+
+def close_widgets(widget, keep=()):
+    """
+    Close the given widget with its children, layout and style, so that neither the
+    kernel nor the front end keep them. Widgets in keep (and their children) are left
+    open.
+    """
+    kept_ids = {id(kept) for kept in keep}
+    widgets = [widget]
+    while widgets:
+        widget = widgets.pop()
+        if id(widget) in kept_ids or widget.comm is None:
+            continue
+
+        widgets.extend(getattr(widget, "children", ()))
+        for name in ("layout", "style"):
+            sub_widget = getattr(widget, name, None)
+            if isinstance(sub_widget, Widget):
+                widgets.append(sub_widget)
+        widget.close()
+
+
+def live_widgets_stats():
+    """
+    Diagnostic of the widgets alive in the kernel.
+
+    Returns
+    -------
+    stats : Dict[str, ...]
+        widgets -- Number of live widgets.
+        comms -- Number of open comms, None if it cannot be known.
+        widgets_by_type -- Number of live widgets for every widget class.
+    """
+    instances = getattr(widget_module, "_instances", None)
+    if instances is None:
+        # ipywidgets < 8
+        instances = Widget.widgets
+
+    try:
+        import comm
+
+        comms = len(comm.get_comm_manager().comms)
+    except (ImportError, AttributeError):
+        comms = None
+
+    return {
+        "widgets": len(instances),
+        "comms": comms,
+        "widgets_by_type": dict(
+            collections.Counter(type(widget).__name__ for widget in instances.values())
+        ),
+    }
@@ -0,0 +1,214 @@
+import functools
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import numpy as np
+from ipywidgets import Widget
+
+# Widgets created and comm messages sent, per thread so that the preloads running in
+# the background are not counted in the interaction of the main thread
+_traffic = threading.local()
+_traffic_lock = threading.Lock()
+# Number of users of the count, and the wrapped methods of Widget while it is counted
+_traffic_users = 0
+_widget_methods = None
+
+
+def _count(name):
+    setattr(_traffic, name, getattr(_traffic, name, 0) + 1)
+
+
+def count_widget_traffic():
+    """
+    Count the widgets opened and the comm messages (open, state updates and close)
+    sent by every widget, until stop_counting_widget_traffic is called as many
+    times. It wraps methods of ipywidgets.Widget while it counts.
+    """
+    global _traffic_users, _widget_methods
+    with _traffic_lock:
+        _traffic_users += 1
+        if _traffic_users > 1:
+            return
+
+        open_widget, send, close = Widget.open, Widget._send, Widget.close
+
+        @functools.wraps(open_widget)
+        def counted_open(self):
+            if self.comm is None:
+                _count("widgets")
+                _count("messages")
+            open_widget(self)
+
+        @functools.wraps(send)
+        def counted_send(self, msg, buffers=None):
+            if self.comm is not None:
+                _count("messages")
+            send(self, msg, buffers)
+
+        @functools.wraps(close)
+        def counted_close(self):
+            if self.comm is not None:
+                _count("messages")
+            close(self)
+
+        _widget_methods = (open_widget, send, close)
+        Widget.open, Widget._send, Widget.close = (
+            counted_open,
+            counted_send,
+            counted_close,
+        )
+
+
+def stop_counting_widget_traffic():
+    """
+    Stop a count started by count_widget_traffic. The methods of ipywidgets.Widget
+    are restored when no count is left.
+    """
+    global _traffic_users, _widget_methods
+    with _traffic_lock:
+        if _traffic_users == 0:
+            return
+        _traffic_users -= 1
+        if _traffic_users == 0:
+            Widget.open, Widget._send, Widget.close = _widget_methods
+            _widget_methods = None
+
+
+def widget_traffic():
+    """
+    Returns
+    -------
+    widgets, messages : int, int
+        Number of widgets created and of comm messages sent by the current thread
+        while the widget traffic was counted.
+    """
+    return getattr(_traffic, "widgets", 0), getattr(_traffic, "messages", 0)
+
+
+@dataclass
+class Interaction:
+    """
+    Measure of one call of an instrumented callback.
+    """
+
+    name: str
+    document_index: int
+    seconds: float
+    widgets_created: int
+    messages: int
+
+
+class InteractionStats:
+    """
+    Latency, widgets created and comm messages sent by the callbacks of an annotation.
+
+    Nested callbacks are measured separately, and the outer ones include them: for
+    instance _labelise includes its _sync_chunks.
+
+    The widget traffic is counted while the stats exist, until they are closed or
+    garbage collected.
+    """
+
+    def __init__(self, on_interaction=None):
+        """
+        Parameters
+        ----------
+        on_interaction : Callable[[Interaction], None], optional
+            Called with every measure. Preloads are measured in the threads of the
+            preload scheduler, so it may be called from these threads.
+        """
+        self.on_interaction = on_interaction
+        self.interactions = []
+        self.lock = threading.Lock()
+        count_widget_traffic()
+        self._finalizer = weakref.finalize(self, stop_counting_widget_traffic)
+
+    def close(self):
+        """
+        Stop counting the widget traffic for these stats.
+        """
+        self._finalizer()
+
+    @contextmanager
+    def measure(self, name, document_index=None):
+        widgets, messages = widget_traffic()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            end_widgets, end_messages = widget_traffic()
+            interaction = Interaction(
+                name=name,
+                document_index=document_index,
+                seconds=seconds,
+                widgets_created=end_widgets - widgets,
+                messages=end_messages - messages,
+            )
+            with self.lock:
+                self.interactions.append(interaction)
+            if self.on_interaction is not None:
+                self.on_interaction(interaction)
+
+    def reset(self):
+        with self.lock:
+            self.interactions = []
+
+    def stats(self):
+        """
+        Returns
+        -------
+        stats : Dict[str, Dict[str, ...]]
+            For every callback name:
+                count -- Number of calls.
+                p50, p95, max -- Latency percentiles, in seconds.
+                widgets_created, messages -- Mean per call.
+        """
+        with self.lock:
+            interactions = list(self.interactions)
+
+        by_name = {}
+        for interaction in interactions:
+            by_name.setdefault(interaction.name, []).append(interaction)
+
+        stats = {}
+        for name, name_interactions in by_name.items():
+            seconds = [interaction.seconds for interaction in name_interactions]
+            stats[name] = {
+                "count": len(name_interactions),
+                "p50": float(np.percentile(seconds, 50)),
+                "p95": float(np.percentile(seconds, 95)),
+                "max": max(seconds),
+                "widgets_created": float(
+                    np.mean(
+                        [interaction.widgets_created for interaction in name_interactions]
+                    )
+                ),
+                "messages": float(
+                    np.mean([interaction.messages for interaction in name_interactions])
+                ),
+            }
+        return stats
+
+
+def instrumented(method):
+    """
+    Measure the calls of a method of an object with an interaction_stats attribute,
+    when it is not None. The calls are measured on the document_index keyword
+    argument of the method if given, else on the current document.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        interaction_stats = self.interaction_stats
+        if interaction_stats is None:
+            return method(self, *args, **kwargs)
+
+        document_index = kwargs.get("document_index", self.current_index)
+        with interaction_stats.measure(method.__name__, document_index):
+            return method(self, *args, **kwargs)
+
+    return wrapper
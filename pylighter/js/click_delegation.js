@@ -0,0 +1,19 @@
+if (!window.pylighter_click_delegation) {
+    window.pylighter_click_delegation = true;
+
+    document.addEventListener('click', function (e) {
+        let char = e.target.closest('.html_document_char');
+        if (!char) {
+            return;
+        }
+
+        let card = char.closest('.html_document_card');
+        let input = card && card.querySelector('.html_document_click_input input');
+        if (!input) {
+            return;
+        }
+
+        input.value = char.dataset.index + ':' + Date.now();
+        input.dispatchEvent(new Event('change', { bubbles: true }));
+    });
+}
\ No newline at end of file
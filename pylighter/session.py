@@ -0,0 +1,426 @@
+import os
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Set
+
+import pandas as pd
+
+from pylighter import config, utils
+from pylighter.chunk_models import Chunk, Chunks, SpanLabels
+from pylighter.storage import DocumentRecord, to_json_value
+
+
+@dataclass
+class ChunksUpdate:
+    """
+    Changes of the chunks of the current document after a labelisation. The chunk is
+    the one created by the labelisation, it is only added to the chunks if added is
+    True (it is not with the eraser).
+    """
+
+    chunk: Chunk
+    added: bool
+    updated_chunks: List[Chunk]
+    removed_chunks: List[Chunk]
+
+
+@dataclass
+class SessionSnapshot:
+    """
+    State of a session to save, taken when the save is requested so that it can be
+    written while the annotation goes on. The labels and additional outputs values
+    are copies.
+    """
+
+    labels: SpanLabels
+    additional_outputs_values: Optional[pd.DataFrame]
+    dirty: Set[int]
+    current_index: int
+
+
+def same_value(old, new):
+    """
+    Whether a value of an additional output is unchanged. Missing values (None, NaN
+    or pandas.NA of the nullable dtypes) are equal to each other, and are never
+    compared with ==, which gives pandas.NA.
+    """
+    old_missing, new_missing = pd.isna(old), pd.isna(new)
+    if old_missing or new_missing:
+        return old_missing and new_missing
+    return bool(old == new)
+
+
+class AnnotationSession:
+    """
+    Headless annotation of a corpus: the labels, the chunks of the current document and
+    the moves from one document to another, without any display.
+
+    Annotation is the widget front end of a session. A session can also be driven
+    directly to annotate from a script, or to benchmark and profile the annotation
+    outside of a notebook.
+    """
+
+    def __init__(
+        self,
+        corpus,
+        labels=None,
+        start_index=None,
+        save_path=config.ANNOTATION_SAVE_PATH,
+        labels_names=config.LABELS_NAMES,
+        additional_outputs_values=None,
+        additional_outputs_elements=None,
+        storage=None,
+        labels_format=config.DEFAULT_LABELS_FORMAT,
+    ):
+        """
+        Parameters
+        ----------
+        corpus : List[str]
+             The corpus to annotate.
+        labels : List[List[str]] or SpanLabels, optional
+            The IOB2 labels of the documents. By default, none of the documents are
+            annotated.
+        start_index : int, optional
+            The index of the document to start on. By default, the index of the
+            current document at the last save in the storage, else 0.
+        save_path : str, optional
+            Path of the csv written by save. Default value is
+            config.ANNOTATION_SAVE_PATH.
+        labels_names : List[str], optional
+            The names of the labels. Default value is config.LABELS_NAMES.
+        additional_outputs_values : pandas.DataFrame, optional
+            Values of the additional outputs of every document.
+        additional_outputs_elements : List[AdditionalOutputElement], optional
+            Additional outputs to fill for every document.
+        storage : storage.Storage, optional
+            Where save writes the documents changed since the last save, instead of
+            rewriting the whole corpus into the save_path csv. The documents already
+            saved in it are restored.
+        labels_format : str, optional
+            Format of the labels in the csv written by save, one of
+            config.LABELS_FORMATS. Default value is config.DEFAULT_LABELS_FORMAT.
+
+        See Annotation for more details on the parameters.
+        """
+        if labels_format not in config.LABELS_FORMATS:
+            raise ValueError(
+                f"labels_format must be one of those {config.LABELS_FORMATS}"
+            )
+        self.labels_format = labels_format
+
+        records = storage.load() if storage is not None else {}
+        if start_index is None:
+            start_index = 0
+            if storage is not None and storage.current_index is not None:
+                # Resume where the last session stopped
+                start_index = min(storage.current_index, len(corpus) - 1)
+
+        # Check input consistency
+        utils.assert_input_consistency(corpus, labels, start_index)
+
+        self.start_index = start_index
+        self.current_index = start_index
+        self.corpus = corpus
+        self.labels = self._init_labels(labels)
+        self.save_path = save_path
+        self.labels_names = labels_names
+        self._init_additional_outputs(
+            additional_outputs_values, additional_outputs_elements
+        )
+        # Indices of the documents changed since the last save
+        self.dirty = set()
+        # Snapshots may be taken and written by an autosave thread
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.storage = storage
+        self._restore(records)
+
+        self.open_document()
+
+    @classmethod
+    def from_file(cls, file_path, **kwargs):
+        """
+        Resume the annotation saved in a csv, on its first document without any chunk.
+        Saves write to the same csv, in the same labels format.
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the csv.
+        **kwargs
+            The other parameters of the annotation, they take precedence over the
+            values loaded from the csv. additional_outputs_elements also gives the
+            types of the saved additional outputs values.
+
+        See utils.load_annotation.
+        """
+        loaded = utils.load_annotation(
+            file_path, kwargs.get("additional_outputs_elements")
+        )
+        loaded["save_path"] = file_path
+        return cls(**{**loaded, **kwargs})
+
+    def _init_labels(self, labels):
+        """
+        Init labels as "empty" if not labels are given. Labels are stored as spans,
+        per character labels are only built when they are read.
+        """
+        if not labels:
+            return SpanLabels(sizes=[len(document) for document in self.corpus])
+        if isinstance(labels, SpanLabels):
+            return labels.copy()
+
+        return SpanLabels.from_labels(labels)
+
+    def _init_additional_outputs(
+        self, additional_outputs_values, additional_outputs_elements
+    ):
+        self.additional_outputs_elements = additional_outputs_elements
+        if (
+            additional_outputs_elements is not None
+            and additional_outputs_values is None
+        ):
+            # Create empty dataframe if none is given
+            columns = [element.name for element in additional_outputs_elements]
+            self.additional_outputs_values = pd.DataFrame(
+                columns=columns, index=range(len(self.corpus))
+            )
+        else:
+            # Use given data
+            self.additional_outputs_values = additional_outputs_values
+
+    def _restore(self, records):
+        """
+        Restore the labels and additional outputs of the saved documents.
+        """
+        for index, record in records.items():
+            if index >= len(self.corpus) or record.document != self.corpus[index]:
+                raise ValueError(
+                    f"Document {index} of the storage does not match the corpus."
+                )
+            self.labels.set_spans(index, record.spans)
+            values = self.additional_outputs_values
+            if record.additional_outputs and values is not None:
+                for name, value in record.additional_outputs.items():
+                    # Outputs removed since the save are not restored
+                    if name in values.columns:
+                        values.iat[index, values.columns.get_loc(name)] = value
+
+    @property
+    def finished(self):
+        """
+        True once the session moved past the last document.
+        """
+        return self.current_index >= len(self.corpus)
+
+    def open_document(self):
+        """
+        Init the variables specific to the current document from its labels.
+        """
+        self.document = self.corpus[self.current_index]
+        self.chunks = Chunks.from_spans(
+            self.labels.get_spans(self.current_index),
+            int(self.labels.sizes[self.current_index]),
+        )
+        self.selected_labeliser = self.labels_names[0]
+        self.label_start_index = None
+
+    def chunk_text(self, chunk):
+        return self.document[chunk.start_index : chunk.end_index + 1]  # noqa
+
+    def select_label(self, label):
+        """
+        Select the label of the next chunks, None selects the eraser.
+        """
+        self.selected_labeliser = label
+
+        # Restart the index to none
+        self.label_start_index = None
+
+    def labelise(self, char_index):
+        """
+        Select the char at char_index: the first selected char starts a chunk with the
+        selected label, the second one ends it.
+
+        Returns
+        -------
+        update : ChunksUpdate
+            The changes of the chunks.
+        """
+        # Selecting the first part and create chunks accordingly
+        if self.label_start_index is None:
+            chunk = Chunk(
+                start_index=char_index,
+                end_index=char_index,
+                label=self.selected_labeliser,
+            )
+            self.label_start_index = char_index
+
+        # Selecting the second part and create chunks accordingly
+        else:
+            start_index = self.label_start_index
+            end_index = char_index
+            if end_index < start_index:
+                start_index, end_index = end_index, start_index
+
+            chunk = Chunk(
+                start_index=start_index,
+                end_index=end_index,
+                label=self.selected_labeliser,
+            )
+            self.label_start_index = None
+
+        # Update chunks with the new chunk
+        updated_chunks, removed_chunks = self.chunks.add_new_chunk_and_update(chunk)
+
+        # Remove the freshly created chunk if the eraser is selected
+        added = True
+        if self.selected_labeliser is None:
+            self.chunks.remove_chunk(chunk)
+            added = False
+
+        return ChunksUpdate(chunk, added, updated_chunks, removed_chunks)
+
+    def delete_chunk(self, chunk):
+        self.chunks.remove_chunk(chunk)
+
+    def clear_current(self):
+        """
+        Clear the current document, ie use the eraser on the whole document.
+        """
+        current_labeliser = self.selected_labeliser
+        self.selected_labeliser = None
+        self.label_start_index = 0
+        update = self.labelise(len(self.document) - 1)
+        self.selected_labeliser = current_labeliser
+        return update
+
+    def commit(self, additional_outputs=None):
+        """
+        Add the chunks of the current document to the labels, and the given values of
+        its additional outputs (a dict from their names to their values).
+        """
+        spans = tuple(self.chunks.to_spans())
+        with self.lock:
+            if spans != self.labels.get_spans(self.current_index):
+                self.labels.set_spans(self.current_index, spans)
+                self.dirty.add(self.current_index)
+
+            values = self.additional_outputs_values
+            for name, value in (additional_outputs or {}).items():
+                # A chained iloc[i][name] assignment writes to a copy when the
+                # columns have different dtypes
+                position = (self.current_index, values.columns.get_loc(name))
+                if not same_value(values.iat[position], value):
+                    values.iat[position] = value
+                    self.dirty.add(self.current_index)
+
+    def change_document(self, direction, skip=False, additional_outputs=None):
+        """
+        Go from the current document at index i to the document at index i + direction.
+        If skip is True, the current annotation is not added to the labels.
+
+        Returns
+        -------
+        moved : bool
+            False if the move would go before the first document.
+        """
+        # Add current annotation to the labels if skip is False
+        if not skip:
+            self.commit(additional_outputs)
+
+        if self.current_index + direction < 0:
+            return False
+
+        # Move to the next document
+        self.current_index += direction
+        if not self.finished:
+            self.open_document()
+        return True
+
+    def snapshot(self):
+        """
+        Copy the committed state of the session and reset the changed documents. The
+        copy only costs a list of references to the spans of every document, and a
+        copy of the additional outputs values.
+        """
+        with self.lock:
+            snapshot = SessionSnapshot(
+                labels=self.labels.copy(),
+                additional_outputs_values=None
+                if self.additional_outputs_values is None
+                else self.additional_outputs_values.copy(),
+                dirty=self.dirty,
+                current_index=self.current_index,
+            )
+            self.dirty = set()
+        return snapshot
+
+    def write_snapshot(self, snapshot, file_path=None):
+        """
+        Write a snapshot, like save. The documents of the snapshot are marked as
+        changed again if the write fails.
+
+        Returns
+        -------
+        file_path : str
+            The absolute path of the saved file.
+        """
+        to_storage = self.storage is not None and not file_path
+        saved = False
+        try:
+            with self.save_lock:
+                if to_storage:
+                    self.storage.write(
+                        [
+                            self._document_record(snapshot, index)
+                            for index in sorted(snapshot.dirty)
+                        ],
+                        current_index=snapshot.current_index,
+                    )
+                    file_path = self.storage.path
+                else:
+                    file_path = os.path.abspath(file_path or self.save_path)
+                    utils.annotation_to_csv(
+                        self.corpus,
+                        snapshot.labels,
+                        snapshot.additional_outputs_values,
+                        file_path,
+                        labels_format=self.labels_format,
+                    )
+            saved = True
+            return file_path
+        finally:
+            # An export to a csv does not save the changes into the storage
+            if not saved or (self.storage is not None and not to_storage):
+                with self.lock:
+                    self.dirty |= snapshot.dirty
+
+    def _document_record(self, snapshot, index):
+        additional_outputs = None
+        if snapshot.additional_outputs_values is not None:
+            additional_outputs = {
+                name: to_json_value(value)
+                for name, value in snapshot.additional_outputs_values.iloc[
+                    index
+                ].items()
+            }
+        return DocumentRecord(
+            index=index,
+            document=self.corpus[index],
+            spans=list(snapshot.labels.get_spans(index)),
+            additional_outputs=additional_outputs,
+        )
+
+    def save(self, file_path=None):
+        """
+        Saves the current state of the corpus and the labels into a csv. With a
+        storage and no file_path, only writes the documents changed since the last
+        save into the storage.
+
+        Returns
+        -------
+        file_path : str
+            The absolute path of the saved file.
+        """
+        return self.write_snapshot(self.snapshot(), file_path)
@@ -1,9 +1,8 @@
-from dataclasses import dataclass
-
 from IPython.display import Javascript, display
 from ipywidgets import HTML, Button, HBox, Layout
 
 from ..utils import text_parser
+from .shortcut import Shortcut  # noqa: F401
 
 
 def create_shortcuts_displays_helpers(shortcuts):
@@ -32,42 +31,6 @@ def create_shortcuts_displays_helpers(shortcuts):
     return shortcuts_class_names
 
 
-@dataclass
-class Shortcut:
-    name: str
-    key: str
-    code: str
-    shift_key: bool = False
-    alt_key: bool = False
-    ctrl_key: bool = False
-
-    def to_js_shortcut(self, prefix="", class_name=""):
-        """
-        Convert shortcut to json containing the shortcut
-        """
-        js = {f"{prefix}class_name": class_name}
-        for key in self.__dict__:
-            value = self.__dict__[key]
-            if type(value) == bool:
-                value = "true" if value else "false"
-            js[f"{prefix}{key}"] = value
-        return js
-
-    def to_pretty_string(self):
-        pretty_string = ""
-        if self.ctrl_key:
-            pretty_string += "Ctrl + "
-
-        if self.alt_key:
-            pretty_string += "Alt + "
-
-        if self.shift_key:
-            pretty_string += "Shift + "
-
-        pretty_string += f"{self.code} (Qwerty Keyboard)"
-        return pretty_string
-
-
 class ShortcutHelper:
     """
     Interface to help user select adequate shortcuts for the annotation.
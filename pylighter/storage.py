@@ -0,0 +1,404 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from pylighter.utils import write_file_atomically
+
+
+@dataclass
+class DocumentRecord:
+    """
+    Saved state of a document: its spans (start_index, end_index, label), end index
+    included, and the values of its additional outputs.
+    """
+
+    index: int
+    document: str
+    spans: List[Tuple[int, int, str]]
+    additional_outputs: Optional[Dict[str, Any]] = None
+
+    def to_dict(self):
+        return {
+            "index": self.index,
+            "document": self.document,
+            "spans": [list(span) for span in self.spans],
+            "additional_outputs": self.additional_outputs,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            index=data["index"],
+            document=data["document"],
+            spans=[tuple(span) for span in data["spans"]],
+            additional_outputs=data.get("additional_outputs"),
+        )
+
+
+def to_json_value(value):
+    """
+    JSON serializable version of a value of an additional output (values read from
+    a DataFrame are NumPy scalars).
+    """
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+class Storage(ABC):
+    """
+    Where a session saves its documents. Only the documents changed since the last
+    save are written.
+    """
+
+    path = None
+    # Index of the current document of the session at its last save, set by load
+    current_index = None
+
+    @abstractmethod
+    def load(self):
+        """
+        Returns
+        -------
+        records : Dict[int, DocumentRecord]
+            The last saved record of every saved document, by index.
+        """
+
+    @abstractmethod
+    def write(self, records, current_index=None):
+        """
+        Save the given records, replacing the previous records of their documents,
+        and the index of the current document of the session.
+        """
+
+    def close(self):
+        pass
+
+
+class JournalStorage(Storage):
+    """
+    Append-only journal of the saved documents, one JSON record per line. A save only
+    appends the changed documents, and the journal is compacted (only the last record
+    of every document is kept) when it holds too many outdated records.
+    """
+
+    def __init__(self, path, compact_ratio=2.0, min_compact_records=100):
+        """
+        Parameters
+        ----------
+        path : str
+            Path of the journal, created on the first save.
+        compact_ratio : float, optional
+            The journal is compacted when it holds more than compact_ratio records per
+            saved document. Default value is 2.
+        min_compact_records : int, optional
+            Smaller journals are never compacted. Default value is 100.
+        """
+        self.path = os.path.abspath(path)
+        self.compact_ratio = compact_ratio
+        self.min_compact_records = min_compact_records
+        self.n_records = 0
+        self.indices = set()
+
+    def load(self):
+        records = {}
+        self.n_records = 0
+        if os.path.exists(self.path):
+            # Size of the complete lines of the journal
+            size = 0
+            with open(self.path, "rb") as journal:
+                for line in journal:
+                    if not line.endswith(b"\n"):
+                        # Last line cut by a crash during a write
+                        break
+                    size += len(line)
+                    try:
+                        data = json.loads(line)
+                    except ValueError as err:
+                        raise ValueError(
+                            f"Corrupted record in {self.path}: {line[:100]!r}"
+                        ) from err
+                    if "current_index" in data:
+                        self.current_index = data["current_index"]
+                        continue
+                    record = DocumentRecord.from_dict(data)
+                    records[record.index] = record
+                    self.n_records += 1
+            if size < os.path.getsize(self.path):
+                # Drop the cut line, the next records would be appended to it
+                os.truncate(self.path, size)
+        self.indices = set(records)
+        return records
+
+    def write(self, records, current_index=None):
+        lines = [json.dumps(record.to_dict()) + "\n" for record in records]
+        if current_index is not None and current_index != self.current_index:
+            lines.append(json.dumps({"current_index": current_index}) + "\n")
+            self.current_index = current_index
+        if not lines:
+            return
+
+        with open(self.path, "a", encoding="utf-8") as journal:
+            journal.write("".join(lines))
+            journal.flush()
+            os.fsync(journal.fileno())
+        self.n_records += len(records)
+        self.indices.update(record.index for record in records)
+
+        if (
+            self.n_records >= self.min_compact_records
+            and self.n_records > self.compact_ratio * len(self.indices)
+        ):
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrite the journal with the last record of every document only.
+        """
+        records = self.load()
+
+        def write(path):
+            with open(path, "w", encoding="utf-8") as journal:
+                for index in sorted(records):
+                    journal.write(json.dumps(records[index].to_dict()) + "\n")
+                if self.current_index is not None:
+                    journal.write(
+                        json.dumps({"current_index": self.current_index}) + "\n"
+                    )
+                journal.flush()
+                os.fsync(journal.fileno())
+
+        write_file_atomically(self.path, write)
+        self.n_records = len(records)
+
+
+class SQLiteStorage(Storage):
+    """
+    SQLite database with one row per saved document, upserted on every save. The
+    database is in WAL mode, so other processes can read it while a session writes
+    it, for instance to follow the progress of the annotation.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path : str
+            Path of the database, created if it does not exist.
+        """
+        self.path = os.path.abspath(path)
+        self.connection = None
+        # Saves may run in another thread than the one that loaded the storage
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            with self.connection:
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS documents ("
+                    "document_index INTEGER PRIMARY KEY, "
+                    "document TEXT NOT NULL, "
+                    "spans TEXT NOT NULL, "
+                    "additional_outputs TEXT, "
+                    "saved_at REAL NOT NULL)"
+                )
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS session ("
+                    "key TEXT PRIMARY KEY, value INTEGER)"
+                )
+        return self.connection
+
+    def load(self):
+        with self.lock:
+            connection = self._connect()
+            rows = connection.execute(
+                "SELECT document_index, document, spans, additional_outputs "
+                "FROM documents ORDER BY document_index"
+            ).fetchall()
+            current_index = connection.execute(
+                "SELECT value FROM session WHERE key = 'current_index'"
+            ).fetchone()
+
+        self.current_index = current_index[0] if current_index else None
+        return {
+            index: DocumentRecord(
+                index=index,
+                document=document,
+                spans=[tuple(span) for span in json.loads(spans)],
+                additional_outputs=json.loads(additional_outputs)
+                if additional_outputs
+                else None,
+            )
+            for index, document, spans, additional_outputs in rows
+        }
+
+    def write(self, records, current_index=None):
+        saved_at = time.time()
+        rows = [
+            (
+                record.index,
+                record.document,
+                json.dumps([list(span) for span in record.spans]),
+                json.dumps(record.additional_outputs)
+                if record.additional_outputs is not None
+                else None,
+                saved_at,
+            )
+            for record in records
+        ]
+        with self.lock:
+            connection = self._connect()
+            # A single transaction for the whole save
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?)", rows
+                )
+                if current_index is not None:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO session VALUES ('current_index', ?)",
+                        (current_index,),
+                    )
+        if current_index is not None:
+            self.current_index = current_index
+
+    def close(self):
+        """
+        Close the connection, it is opened again by the next load or write.
+        """
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+class Autosave:
+    """
+    Saves a session in a background thread, every interval seconds and every `every`
+    changes of document. The snapshot of the session is taken when the save is
+    requested, the serialization and the write run in the thread. Saves are written in
+    the order they were requested, by a single thread.
+    """
+
+    def __init__(self, session, interval=None, every=None, on_save=None, on_error=None):
+        """
+        Parameters
+        ----------
+        session : AnnotationSession
+            The session to save, with session.save semantics.
+        interval : float, optional
+            Seconds between two saves. By default, saves are not timed.
+        every : int, optional
+            Number of changes of document between two saves. By default, saves do not
+            depend on the changes of document.
+        on_save : Callable[[str], None], optional
+            Called with the path of the saved file after the saves requested with
+            notify=True.
+        on_error : Callable[[Exception], None], optional
+            Called with the error when a save fails.
+        """
+        self.session = session
+        self.interval = interval
+        self.every = every
+        self.on_save = on_save
+        self.on_error = on_error
+        self.changes = 0
+        # Snapshot waiting to be written, and whether on_save is called after it
+        self.pending = None
+        self.notify = False
+        self.saving = False
+        self.stopped = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def document_changed(self):
+        self.changes += 1
+        if self.every and self.changes >= self.every:
+            self.request()
+
+    def request(self, notify=False):
+        """
+        Take a snapshot of the session and save it in the background.
+        """
+        snapshot = self.session.snapshot()
+        self.changes = 0
+        with self.condition:
+            if self.pending is not None:
+                # Not written yet, the new snapshot replaces it
+                snapshot.dirty |= self.pending.dirty
+            self.pending = snapshot
+            self.notify = self.notify or notify
+            self.condition.notify_all()
+
+    def _next_snapshot(self):
+        """
+        Wait for a requested save or for the interval, None once stopped.
+        """
+        deadline = None if self.interval is None else time.monotonic() + self.interval
+        with self.condition:
+            while self.pending is None and not self.stopped:
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    if self.session.dirty:
+                        break
+                    # Nothing changed, a snapshot would only copy the session under
+                    # its lock and block the annotation
+                    deadline = time.monotonic() + self.interval
+                    continue
+                self.condition.wait(timeout)
+
+            if self.pending is None and self.stopped:
+                return None, False
+            snapshot, notify = self.pending, self.notify
+            self.pending, self.notify = None, False
+            self.saving = True
+
+        if snapshot is None:
+            # The interval elapsed
+            snapshot = self.session.snapshot()
+        return snapshot, notify
+
+    def _run(self):
+        while True:
+            snapshot, notify = self._next_snapshot()
+            if snapshot is None:
+                return
+
+            try:
+                # Without changes, there is nothing to write
+                if snapshot.dirty or notify:
+                    file_path = self.session.write_snapshot(snapshot)
+                    if notify and self.on_save is not None:
+                        self.on_save(file_path)
+            except Exception as err:
+                if self.on_error is not None:
+                    self.on_error(err)
+            finally:
+                with self.condition:
+                    self.saving = False
+                    self.condition.notify_all()
+
+    def flush(self):
+        """
+        Wait for the requested saves to be written.
+        """
+        with self.condition:
+            while self.pending is not None or self.saving:
+                self.condition.wait()
+
+    def stop(self):
+        """
+        Write the requested saves and stop the thread.
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join()
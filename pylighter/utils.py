@@ -1,10 +1,22 @@
+import ast
 import colorsys
+import csv
+import functools
+import json
+import os
 import pkgutil
+import re
+import shutil
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait as wait_for_futures
 from dataclasses import dataclass
 
-import pandas as pd
-
 from pylighter import config
+from pylighter.chunk_models import SpanLabels, corpus_labels_to_spans
+
+TEMPLATE_PLACEHOLDER = re.compile(r"<% (\w+) %>")
 
 
 def text_parser(file_name, **kwargs):
@@ -20,43 +32,288 @@ def text_parser(file_name, **kwargs):
     file_content : str
         The content of the file
     """
+    parts = load_template(file_name)
+
+    # Literal text and placeholders names alternate
+    file_content = [
+        part if index % 2 == 0 else kwargs.get(part, f"<% {part} %>")
+        for index, part in enumerate(parts)
+    ]
+    return "".join(file_content)
+
+
+@functools.lru_cache(maxsize=None)
+def load_template(file_name):
+    """
+    Read a template of the package once per process and split it on its placeholders.
 
+    Returns
+    -------
+    parts : Tuple[str]
+        The literal text of the template, without new lines, alternating with the names
+        of its placeholders.
+    """
     file_content = str(pkgutil.get_data("pylighter", file_name), "utf-8")
     file_content = file_content.replace("\n", "")
+    return tuple(TEMPLATE_PLACEHOLDER.split(file_content))
 
-    for key in kwargs:
-        file_content = file_content.replace(f"<% {key} %>", kwargs[key])
 
-    return file_content
+def chunk_html_display(text):
+    if text and text[-1] == " ":
+        text = text[:-1] + "␣"
+    return f"{text}"
 
 
-def js_add_el_to_div(class_name_source, class_name_target):
+def encode_spans(spans):
     """
-    Js function to append source element to the target one.
+    Compact JSON of the (start_index, end_index, label) spans of a document.
     """
-    js = f"const el = document.getElementsByClassName('{class_name_target}')[0];"
-    js += "if (el) "
-    js += f"el.appendChild(document.getElementsByClassName('{class_name_source}')[0])"
-    return js
+    return json.dumps([list(span) for span in spans], separators=(",", ":"))
 
 
-def js_remove_el(el_id_class_name):
-    js = f"const el = document.getElementsByClassName('{el_id_class_name}')[0];"
-    js += "if (el) el.remove()"
-    return js
+def decode_spans(text):
+    return [tuple(span) for span in json.loads(text)]
 
 
-def chunk_html_display(text):
-    if text and text[-1] == " ":
-        text = text[:-1] + "␣"
-    return f"{text}"
+def decode_iob2_labels(text):
+    """
+    Parse the IOB2 labels of a document written as a Python list by pandas, e.g.
+    "['B-l1', 'I-l1', 'O']".
+    """
+    if text == "[]":
+        return []
+    if '"' in text or "\\" in text:
+        # Labels with quotes are escaped by repr, only literal_eval reads them
+        return ast.literal_eval(text)
+    return text[2:-2].split("', '")
+
+
+# Column of the labels in the csv, by labels format
+LABELS_COLUMNS = {"iob2": "labels", "spans": "spans"}
+
 
+def csv_labels_format(header):
+    """
+    Labels format of a csv written by annotation_to_csv, from its header.
+    """
+    for labels_format, column in LABELS_COLUMNS.items():
+        if column in header:
+            return labels_format
+    raise ValueError("The csv has neither a labels nor a spans column")
+
+
+def read_annotation_csv(file_path):
+    """
+    Read a csv written by annotation_to_csv, in any labels format, one row at a time.
+
+    The labels are kept as spans, the IOB2 labels of a document are built when they
+    are read from the returned SpanLabels, and its chunks with Chunks.from_spans.
+
+    Returns
+    -------
+    corpus : List[str]
+    labels : SpanLabels
+    columns : Dict[str, List[str]]
+        The raw values of the other columns (the additional outputs), empty for
+        missing values.
+    labels_format : str
+        The labels format of the csv, see config.LABELS_FORMATS.
+    """
+    # A field holds the labels of a whole document, the limit is process wide
+    field_size_limit = csv.field_size_limit()
+    csv.field_size_limit(max(field_size_limit, os.path.getsize(file_path)))
+    try:
+        with open(file_path, newline="", encoding="utf-8") as csv_file:
+            reader = csv.reader(csv_file, delimiter=";")
+            header = next(reader)
+            labels_format = csv_labels_format(header)
+            labels_column = header.index(LABELS_COLUMNS[labels_format])
+            document_column = header.index("document")
+            other_columns = [
+                (index, name)
+                for index, name in enumerate(header)
+                if index not in (document_column, labels_column)
+            ]
+
+            corpus, spans_list = [], []
+            columns = {name: [] for _, name in other_columns}
+            for row in reader:
+                corpus.append(row[document_column])
+                if labels_format == "spans":
+                    spans_list.append(decode_spans(row[labels_column]))
+                else:
+                    labels = decode_iob2_labels(row[labels_column])
+                    spans_list.append(corpus_labels_to_spans([labels])[0])
+                for index, name in other_columns:
+                    columns[name].append(row[index])
+    finally:
+        csv.field_size_limit(field_size_limit)
+
+    labels = SpanLabels([len(document) for document in corpus], spans_list)
+    return corpus, labels, columns, labels_format
+
+
+def parse_additional_output(values, display_type=None):
+    """
+    Values of an additional output read by read_annotation_csv, typed after the
+    display type of its element, or like pandas.read_csv does without it.
+
+    Returns
+    -------
+    column : pandas.Series
+        The values, NaN for the missing ones.
+    """
+    import pandas as pd
+
+    column = pd.Series([value if value != "" else None for value in values], dtype=object)
+    if display_type in ("text", "text_area"):
+        return column
+
+    present = set(column.dropna())
+    if display_type == "checkbox" or (
+        display_type is None and present and present <= {"True", "False"}
+    ):
+        return column.map({"True": True, "False": False})
+
+    try:
+        return pd.to_numeric(column)
+    except (TypeError, ValueError):
+        return column
+
+
+def load_annotation(file_path, additional_outputs_elements=None):
+    """
+    Load a csv saved by an annotation, in any labels format, to resume it.
 
-def annotation_to_csv(corpus, labels, additional_outputs_values, file_path):
-    df = pd.DataFrame(data={"document": corpus, "labels": labels})
+    Parameters
+    ----------
+    file_path : str
+        Path of the csv.
+    additional_outputs_elements : List[AdditionalOutputElement], optional
+        The additional outputs of the annotation, their values are typed after their
+        display types. By default, the types of the values are inferred.
+
+    Returns
+    -------
+    kwargs : Dict[str, ...]
+        The corpus, labels (as SpanLabels), additional_outputs_values and
+        labels_format of the annotation, and the start_index of its first document
+        without any chunk (the last document if they all have chunks), as keyword
+        arguments of Annotation.
+    """
+    import pandas as pd
+
+    corpus, labels, columns, labels_format = read_annotation_csv(file_path)
+
+    display_types = {
+        element.name: element.display_type
+        for element in additional_outputs_elements or []
+    }
+    # The elements added since the save have no values yet
+    for name in display_types:
+        columns.setdefault(name, [""] * len(corpus))
+
+    additional_outputs_values = None
+    if columns:
+        additional_outputs_values = pd.DataFrame(
+            {
+                name: parse_additional_output(values, display_types.get(name))
+                for name, values in columns.items()
+            },
+            index=range(len(corpus)),
+        )
+
+    start_index = next(
+        (index for index, spans in enumerate(labels.spans_list) if not spans),
+        max(len(corpus) - 1, 0),
+    )
+    return {
+        "corpus": corpus,
+        "labels": labels,
+        "additional_outputs_values": additional_outputs_values,
+        "start_index": start_index,
+        "labels_format": labels_format,
+    }
+
+
+def annotation_to_csv(
+    corpus, labels, additional_outputs_values, file_path, labels_format="iob2"
+):
+    """
+    Write the corpus, its labels and additional outputs values into a csv.
+
+    Parameters
+    ----------
+    labels : List[List[str]] or SpanLabels
+        The IOB2 labels of the documents.
+    labels_format : str, optional
+        One of config.LABELS_FORMATS. Default value is "iob2".
+    """
+    # Imported here so that the helpers of this module do not import pandas
+    import pandas as pd
+
+    if labels_format == "spans":
+        if isinstance(labels, SpanLabels):
+            spans_list = labels.spans_list
+        else:
+            spans_list = corpus_labels_to_spans(labels)
+        labels_column = [encode_spans(spans) for spans in spans_list]
+    elif labels_format == "iob2":
+        if isinstance(labels, SpanLabels):
+            labels = labels.to_list()
+        labels_column = labels
+    else:
+        raise ValueError(f"labels_format must be one of those {config.LABELS_FORMATS}")
+
+    df = pd.DataFrame(
+        data={"document": corpus, LABELS_COLUMNS[labels_format]: labels_column}
+    )
     if additional_outputs_values is not None:
         df = pd.concat([df, additional_outputs_values], axis=1)
-    df.to_csv(file_path, sep=";", index=False)
+
+    write_file_atomically(
+        file_path, lambda path: df.to_csv(path, sep=";", index=False)
+    )
+
+
+def write_file_atomically(file_path, write):
+    """
+    Write a temporary file moved in place once complete, so that a crash never leaves
+    a partial file. Files that are not regular files, e.g. /dev/null, are written
+    directly.
+
+    Parameters
+    ----------
+    file_path : str
+        Path of the file to write. A symlink is kept, its target is replaced.
+    write : Callable[[str], None]
+        Writes the file at the given path.
+    """
+    file_path = os.path.realpath(file_path)
+    if os.path.exists(file_path) and not os.path.isfile(file_path):
+        write(file_path)
+        return
+
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(file_path), prefix=f".{os.path.basename(file_path)}."
+    )
+    os.close(fd)
+    try:
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, temp_path)
+        else:
+            # mkstemp creates private files, new files get the mode open gives them
+            mode_path = f"{temp_path}.mode"
+            open(mode_path, "x").close()
+            try:
+                shutil.copymode(mode_path, temp_path)
+            finally:
+                os.remove(mode_path)
+        write(temp_path)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
 
 
 def assert_IOB2_format(labels_list):
@@ -80,7 +337,9 @@ def assert_IOB2_format(labels_list):
 def assert_input_consistency(corpus, labels, start_index):
     if labels:
         assert len(corpus) == len(labels)
-        assert_IOB2_format(labels)
+        # Spans are valid IOB2 labels by construction
+        if not isinstance(labels, SpanLabels):
+            assert_IOB2_format(labels)
 
     assert start_index >= 0
     assert start_index < len(corpus)
@@ -95,12 +354,6 @@ def compute_selected_label_color(str_color_hex):
     return f"hsl({int(hue*360)}, {int(saturation * 100)}%, {int(lightness * 100)}%)"
 
 
-def wait_for_threads(threads):
-    for thread in threads:
-        thread.join()
-    threads = []
-
-
 @dataclass
 class LabelColor:
     name: str
@@ -122,23 +375,244 @@ class AdditionalOutputElement:
 
 
 class PreloadedDisplays:
+    """
+    Cache of the preloaded displays, keyed by document index.
+
+    The displays of the documents around the current one are preloaded. The other
+    displays are kept as long as the cache is within its budget and evicted in least
+    recently used order.
+    """
+
     def __init__(
         self,
+        preload_ahead=1,
+        preload_behind=1,
+        max_documents=None,
+        max_chars=None,
+        on_drop=None,
     ):
-        self.previous = {}
-        self.current = {}
-        self.next = {}
-
-    def update(self, direction):
-        if direction == 1:
-            self.previous = self.current
-            self.current = self.next
-            self.next = {}
-        elif direction == -1:
-            self.next = self.current
-            self.current = self.previous
-            self.previous = {}
+        """
+        Parameters
+        ----------
+        preload_ahead : int, optional
+            Number of documents to preload after the current one.
+        preload_behind : int, optional
+            Number of documents to preload before the current one.
+        max_documents : int, optional
+            Maximum number of displays kept. By default, there is no limit.
+        max_chars : int, optional
+            Maximum number of chars of the documents whose display is kept. By
+            default, there is no limit.
+        on_drop : Callable[[Dict[str, ...]], None], optional
+            Called with every preloaded display that is evicted, to release its
+            widgets.
+        """
+        self.preload_ahead = preload_ahead
+        self.preload_behind = preload_behind
+        self.max_documents = max_documents
+        self.max_chars = max_chars
+        self.on_drop = on_drop
+
+        self.displays = OrderedDict()
+        self.sizes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, index):
+        return index in self.displays
+
+    def __len__(self):
+        return len(self.displays)
+
+    @property
+    def chars(self):
+        return sum(self.sizes.values())
+
+    def window(self, current_index, corpus_size):
+        """
+        Return the indices of the documents to preload around current_index, from the
+        most to the least urgent.
+        """
+        indices = [current_index]
+        for distance in range(1, max(self.preload_ahead, self.preload_behind) + 1):
+            if distance <= self.preload_ahead and current_index + distance < corpus_size:
+                indices.append(current_index + distance)
+            if distance <= self.preload_behind and current_index - distance >= 0:
+                indices.append(current_index - distance)
+        return indices
+
+    def get(self, index, size, count=False):
+        """
+        Return the preloaded display of the document at the given index. It is an
+        empty dict, to fill, if the document is not preloaded yet.
+
+        If count is True, the lookup counts as a hit or a miss.
+        """
+        preloaded = self.displays.get(index)
+        if count:
+            if preloaded:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if preloaded is None:
+            preloaded = {}
+            self.displays[index] = preloaded
+            self.sizes[index] = size
+        self.displays.move_to_end(index)
+        return preloaded
+
+    def _over_budget(self):
+        return (self.max_documents is not None and len(self) > self.max_documents) or (
+            self.max_chars is not None and self.chars > self.max_chars
+        )
+
+    def evict(self, protected=(), defer=None):
+        """
+        Evict the least recently used displays until the cache is within its budget.
+        The displays of protected indices are never evicted. If given, defer is called
+        with the index of an evicted display and the function releasing it, to release
+        it once its preload is done instead of waiting for it.
+        """
+        for index in list(self.displays):
+            if not self._over_budget():
+                break
+            if index not in protected:
+                self.drop(index, defer)
+
+    def drop(self, index, defer=None):
+        preloaded = self.displays.pop(index)
+        del self.sizes[index]
+        if self.on_drop is None:
+            return
+
+        def release():
+            # Read once the preload is done, a display may be filled meanwhile
+            if preloaded:
+                self.on_drop(preloaded)
+
+        if defer is None:
+            release()
         else:
-            self.next = {}
-            self.current = {}
-            self.previous = {}
+            defer(index, release)
+
+    def clear(self):
+        for index in list(self.displays):
+            self.drop(index)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "documents": len(self),
+            "chars": self.chars,
+        }
+
+
+class PreloadScheduler:
+    """
+    Runs the preloads of the documents on a bounded pool of threads.
+
+    The preloads are keyed by document index: a document is preloaded at most once at
+    a time, the preloads that are not started yet can be cancelled when the user
+    jumps away, and the document about to be displayed never waits behind them.
+    """
+
+    def __init__(self, max_workers=2):
+        """
+        Parameters
+        ----------
+        max_workers : int, optional
+            Maximum number of documents preloaded at the same time.
+        """
+        self.max_workers = max_workers
+        self.executor = None
+        self.futures = {}
+
+    def __contains__(self, index):
+        return index in self.futures
+
+    def submit(self, index, function, **kwargs):
+        """
+        Preload the document at the given index in the background, unless it is
+        already being preloaded.
+        """
+        self._forget_done()
+        if index in self.futures:
+            return self.futures[index]
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="pylighter-preload"
+            )
+        future = self.executor.submit(function, **kwargs)
+        self.futures[index] = future
+        return future
+
+    def run_now(self, index, function, **kwargs):
+        """
+        Preload the document at the given index in the current thread, without
+        waiting behind the other preloads. If its preload already started, wait for
+        it instead.
+        """
+        future = self.futures.pop(index, None)
+        if future is not None and not future.cancel():
+            try:
+                future.result()
+                return
+            except Exception:
+                # The failed preload is loaded again in the current thread
+                pass
+        function(**kwargs)
+
+    def when_done(self, index, callback):
+        """
+        Call callback once the preload of the document at the given index is done,
+        cancelling it if it is not started yet, or right away if there is none. The
+        preload is forgotten, the document can be preloaded again.
+        """
+        future = self.futures.pop(index, None)
+        if future is None:
+            callback()
+            return
+
+        future.cancel()
+        # Called in the preload thread if the preload is running, else right away
+        future.add_done_callback(lambda future: callback())
+
+    def cancel_stale(self, keep=()):
+        """
+        Cancel the preloads that are not started yet, except the ones of the indices
+        to keep.
+        """
+        for index, future in list(self.futures.items()):
+            if index not in keep and future.cancel():
+                del self.futures[index]
+
+    def wait(self, index=None):
+        """
+        Wait for the preload of the document at the given index, or for all the
+        preloads if no index is given.
+        """
+        indices = list(self.futures) if index is None else [index]
+        futures = [self.futures.pop(index, None) for index in indices]
+        # A failed preload leaves its display empty, it is loaded again when needed
+        wait_for_futures([future for future in futures if future is not None])
+
+    def shutdown(self):
+        """
+        Cancel the pending preloads, wait for the running ones and stop the threads.
+        """
+        self.cancel_stale()
+        self.wait()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def _forget_done(self):
+        # A failed preload leaves its display empty, it is loaded again when needed
+        for index, future in list(self.futures.items()):
+            if future.done():
+                del self.futures[index]
@@ -0,0 +1,36 @@
+import pytest
+
+from pylighter import utils
+
+
+@pytest.fixture
+def front_end(monkeypatch):
+    """
+    Record the comm messages sent to the front end by the widgets created during the
+    test. Needs the comm package, used by ipywidgets from version 8.
+    """
+    pytest.importorskip("comm")
+    from .front_end import FrontEnd
+
+    front_end = FrontEnd()
+    front_end.install(monkeypatch)
+    return front_end
+
+
+@pytest.fixture(autouse=True)
+def shutdown_preloads(monkeypatch):
+    """
+    Stop the preloads of every test so that they do not take char buttons from the
+    pool during the next one.
+    """
+    preload_schedulers = []
+    init = utils.PreloadScheduler.__init__
+
+    def tracked_init(self, *args, **kwargs):
+        init(self, *args, **kwargs)
+        preload_schedulers.append(self)
+
+    monkeypatch.setattr(utils.PreloadScheduler, "__init__", tracked_init)
+    yield
+    for preload_scheduler in preload_schedulers:
+        preload_scheduler.shutdown()
@@ -0,0 +1,71 @@
+"""
+Stand-in for the front end of the widgets: it records the comm messages sent by the
+kernel, so that tests can check how many messages an action costs without a browser.
+"""
+import collections
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import comm
+from comm.base_comm import BaseComm
+
+
+@dataclass
+class Message:
+    msg_type: str  # comm_open, comm_msg or comm_close
+    comm_id: str
+    data: dict
+
+
+class RecordingComm(BaseComm):
+    def __init__(self, front_end, *args, **kwargs):
+        self.front_end = front_end
+        super().__init__(*args, **kwargs)
+
+    def publish_msg(self, msg_type, data=None, metadata=None, buffers=None, **keys):
+        self.front_end.record(Message(msg_type, self.comm_id, data or {}))
+
+
+class FrontEnd:
+    """
+    Records the messages of the comms created while it is installed.
+    """
+
+    def __init__(self):
+        self.messages = []
+        # Documents are preloaded in other threads
+        self.lock = threading.Lock()
+
+    def create_comm(self, *args, **kwargs):
+        return RecordingComm(self, *args, **kwargs)
+
+    def record(self, message):
+        with self.lock:
+            self.messages.append(message)
+
+    @contextmanager
+    def recording(self):
+        """
+        Yields the list of the messages sent inside the context.
+        """
+        recorded = []
+        start = len(self.messages)
+        try:
+            yield recorded
+        finally:
+            with self.lock:
+                recorded.extend(self.messages[start:])
+
+    @staticmethod
+    def count(messages, msg_type=None):
+        return sum(
+            1 for message in messages if msg_type is None or message.msg_type == msg_type
+        )
+
+    @staticmethod
+    def counts(messages):
+        return dict(collections.Counter(message.msg_type for message in messages))
+
+    def install(self, monkeypatch):
+        monkeypatch.setattr(comm, "create_comm", self.create_comm)
@@ -1,10 +1,14 @@
 import ast
+import gc
+import threading
 from datetime import datetime
 
 import pandas as pd
 import pytest
 
-from pylighter import AdditionalOutputElement, Annotation
+from pylighter import AdditionalOutputElement, Annotation, display
+from pylighter.chunk_models import Chunk
+from pylighter.instrumentation import InteractionStats
 
 
 @pytest.mark.parametrize(
@@ -359,3 +363,413 @@ def test_additional_outputs(
         assert df.element.to_list()[1] == additional_outputs_values.iloc[1]["element"]
     else:
         assert pd.isna(df.element.to_list()[1])
+
+
+def test_renderer():
+    with pytest.raises(ValueError):
+        Annotation(["Test"], renderer="unknown")
+
+
+@pytest.mark.parametrize(
+    "labels, clicks, expected",
+    [
+        (["O", "O", "O", "O"], [1, 2], ["O", "B-1", "I-1", "O"]),
+        (["O", "O", "O", "O"], [3, 3, 0], ["B-1", "O", "O", "B-1"]),
+        (["B-2", "I-2", "O", "O"], [1, 3], ["B-2", "B-1", "I-1", "I-1"]),
+    ],
+)
+def test_html_renderer(labels, clicks, expected):
+    corpus = ["Test"]
+    annotation = Annotation(
+        corpus, labels=[labels], labels_names=["1", "2"], renderer="html"
+    )
+    html_document = annotation.html_document
+
+    assert annotation.char_buttons is None
+    assert html_document.text.value.count("html_document_char") == len(corpus[0])
+
+    for click_index, char_index in enumerate(clicks):
+        # The front end writes "char_index:timestamp" in the hidden input
+        html_document.click_input.value = f"{char_index}:{click_index}"
+
+    assert annotation.chunks.to_labels() == expected
+    assert html_document.spans == annotation.chunks.to_spans()
+    # The highlights only apply to this document
+    assert html_document.class_name in html_document.text._dom_classes
+    for start_index, end_index, label in html_document.spans:
+        assert (
+            f".{html_document.class_name} .html_document > "
+            f"span:nth-child(n+{start_index + 1}):nth-child(-n+{end_index + 1})"
+            in html_document.highlights.value
+        )
+    assert ":root" not in html_document.highlights.value
+
+
+def test_window():
+    corpus = ["aaaa bbbb cccc dddd"]
+    annotation = Annotation(corpus, labels_names=["1", "2"], window_size=10)
+    char_window = annotation.char_buttons
+
+    assert char_window.window_starts == [0, 10]
+    assert len(char_window) == len(list(char_window)) == 10
+    assert [button.description for button in char_window] == list("aaaa bbbb ")
+
+    # Labelise "cc" while it is not displayed
+    annotation._labelise(None, 12)
+    annotation._labelise(None, 13)
+    assert annotation.chunks.to_labels()[12:14] == ["B-1", "I-1"]
+    assert char_window[12:14] == []
+
+    char_window.move(direction=1)
+    assert len(char_window) == len(list(char_window)) == 9
+    assert [button.description for button in char_window] == list("cccc dddd")
+    assert [
+        "1_color" in button._dom_classes for button in char_window[10:15]
+    ] == [False, False, True, True, False]
+
+    # Clicking on the first visible char uses its global index
+    char_window[10].click()
+    char_window[10].click()
+    assert annotation.chunks.to_labels()[10:14] == ["B-1", "O", "B-1", "I-1"]
+
+    char_window.move(direction=-1)
+    assert char_window[0].description == "a"
+    assert "1_color" not in char_window[0]._dom_classes
+
+
+def test_char_buttons_reused(tmp_path):
+    corpus = ["Doc 0", "Doc 1", "Doc 2", "Doc 3"]
+    annotation = Annotation(
+        corpus, save_path=tmp_path / "annotation.csv", max_preloaded_documents=3
+    )
+    first_buttons = {id(button) for button in annotation.char_buttons}
+
+    annotation._change_document(None, direction=1)
+    # The preload of document 2 could take some of the buttons of document 0
+    annotation.preload_scheduler.wait()
+    annotation._change_document(None, direction=1)
+
+    # Document 0 left the preloaded documents, its buttons are used by document 3
+    annotation.preload_scheduler.wait()
+    assert 0 not in annotation.preloaded_displays
+    last_buttons = annotation.preloaded_displays.displays[3]["char_buttons"]
+    assert {id(button) for button in last_buttons} == first_buttons
+    assert "".join(button.description for button in last_buttons) == corpus[3]
+
+    annotation._change_document(None, direction=1)
+    assert annotation.char_buttons == last_buttons
+    annotation.char_buttons[0].click()
+    assert annotation.chunks.to_labels() == ["B-l1", "O", "O", "O", "O"]
+
+
+def test_widgets_closed_on_navigation(tmp_path):
+    corpus = [f"Document {index:02d}" for index in range(20)]
+    labels = [["B-l1", "I-l1"] + ["O"] * (len(document) - 2) for document in corpus]
+    annotation = Annotation(corpus, labels=labels, save_path=tmp_path / "annotation.csv")
+
+    live_widgets = []
+    for _ in range(15):
+        annotation._labelise(None, 3)
+        annotation._labelise(None, 5)
+        annotation._change_document(None, direction=1)
+        annotation.preload_scheduler.wait()
+        live_widgets.append(display.live_widgets_stats()["widgets"])
+
+    assert len(set(live_widgets[5:])) == 1
+
+
+def test_preloaded_displays(tmp_path):
+    corpus = [f"Document {index}" for index in range(10)]
+    annotation = Annotation(
+        corpus, save_path=tmp_path / "annotation.csv", preload_ahead=2, preload_behind=1
+    )
+    annotation.preload_scheduler.wait()
+    assert list(annotation.preloaded_displays.displays) == [2, 1, 0]
+
+    # Jumping within the preloaded documents is a hit
+    annotation._change_document(None, direction=2)
+    assert annotation.preloaded_displays.stats()["hits"] == 1
+
+    # Jumping back to a recently displayed document is still a hit
+    annotation._change_document(None, direction=5)
+    annotation._change_document(None, direction=-5)
+    stats = annotation.preloaded_displays.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+    assert stats["documents"] <= 6
+
+
+def test_preloads_do_not_pile_up(tmp_path):
+    corpus = [f"Document {index}" for index in range(30)]
+    annotation = Annotation(
+        corpus, save_path=tmp_path / "annotation.csv", preload_ahead=3
+    )
+
+    for direction in [5, 5, -3, 10, 1, 1]:
+        annotation._change_document(None, direction=direction)
+        # Only the preloads of the documents around the current one are scheduled
+        assert len(annotation.preload_scheduler.futures) <= 4
+
+    annotation.preload_scheduler.wait()
+    assert annotation.preload_scheduler.futures == {}
+
+
+def test_persistent_shell(tmp_path):
+    corpus = ["Document one", "Document two", "Document three"]
+    additional_infos = pd.DataFrame({"source": ["a", "b", "c"]})
+    annotation = Annotation(
+        corpus,
+        save_path=tmp_path / "annotation.csv",
+        additional_infos=additional_infos,
+        additional_outputs_elements=[
+            AdditionalOutputElement("flag", "checkbox", "Flag", default_value=False)
+        ],
+        persistent_shell=True,
+    )
+    shell = annotation.shell
+    annotation._labelise(None, 0)
+    annotation._labelise(None, 7)
+    annotation.additional_outputs_elements_displays[0].value = True
+    assert len(annotation.chunk_area.box.children) == 1
+
+    annotation._change_document(None, direction=1)
+    assert annotation.shell is shell
+    assert shell.core_box.children == (
+        annotation.preloaded_displays.get(1, len(corpus[1]))["core_display"],
+    )
+    assert shell.additional_infos_display.children[0].value == "source:&nbsp;<b>b</b>"
+    assert annotation.additional_outputs_elements_displays[0].value is False
+
+    # Moving through the header index
+    shell.document_number_input.value = 0
+    assert annotation.current_index == 0
+    assert shell.additional_outputs_inputs[0].value is True
+    assert len(annotation.chunk_area.box.children) == 1
+    assert annotation.labels[0] == ["B-l1"] + ["I-l1"] * 7 + ["O"] * 4
+
+
+def test_styles_rendered_once(tmp_path):
+    corpus = ["Document one", "Document two"]
+    annotation = Annotation(corpus, save_path=tmp_path / "annotation.csv")
+    styles = display.define_custom_styles(
+        annotation.labels_colors, annotation.char_params
+    )
+
+    annotation._change_document(None, direction=1)
+    assert (
+        display.define_custom_styles(annotation.labels_colors, annotation.char_params)
+        is styles
+    )
+    assert styles.comm is not None
+    assert display.define_custom_styles(
+        annotation.labels_colors, {**annotation.char_params, "font_size": "large"}
+    ) is not styles
+
+
+def test_highlight_sends_only_differences(monkeypatch, tmp_path):
+    corpus = ["a" * 100]
+    labels = [["O"] * 40 + ["B-l1"] + ["I-l1"] * 9 + ["O"] * 50]
+    annotation = Annotation(corpus, labels=labels, save_path=tmp_path / "annotation.csv")
+    char_buttons = {id(button) for button in annotation.char_buttons}
+
+    sent = []
+    send_state = display.Widget.send_state
+
+    def counting_send_state(widget, *args, **kwargs):
+        if id(widget) in char_buttons:
+            sent.append(widget)
+        return send_state(widget, *args, **kwargs)
+
+    monkeypatch.setattr(display.Widget, "send_state", counting_send_state)
+    annotation._clear_current(None)
+
+    # Only the 10 highlighted chars change, with a single message each
+    assert len(sent) == 10
+    assert all(
+        "l1_color" not in button._dom_classes for button in annotation.char_buttons
+    )
+
+
+def test_pre_annotated_chunks_displayed_at_once(monkeypatch, tmp_path):
+    corpus = ["ab " * 150, "Second document"]
+    labels = [["B-l2", "I-l2", "O"] * 150, ["O"] * len(corpus[1])]
+
+    displayed = []
+    monkeypatch.setattr(display, "display", displayed.append)
+    annotation = Annotation(corpus, labels=labels, save_path=tmp_path / "annotation.csv")
+
+    assert len(annotation.chunk_area.box.children) == 150
+    assert not any(
+        "id_class_chunk" in str(getattr(element, "data", "")) for element in displayed
+    )
+    assert all(
+        ("l2_color" in button._dom_classes) == (char != " ")
+        for button, char in zip(annotation.char_buttons, corpus[0])
+    )
+
+    # Highlights of a skipped annotation do not stay when coming back
+    annotation._labelise(None, 2)
+    annotation._labelise(None, 2)
+    annotation._change_document(None, direction=1, skip=True)
+    annotation._change_document(None, direction=-1, skip=True)
+    assert "l1_color" not in annotation.char_buttons[2]._dom_classes
+    assert len(annotation.chunk_area.box.children) == 150
+
+
+def test_chunk_area():
+    def delete_chunk(button, chunk):
+        pass
+
+    chunk_area = display.ChunkArea()
+    chunks = [Chunk(0, 2, "l1"), Chunk(4, 5, "l2"), Chunk(7, 9, "l1")]
+    chunk_area.set_chunks([(chunk, "text") for chunk in chunks[:2]], delete_chunk)
+    chunk_area.add(chunks[2], "new", delete_chunk)
+    assert len(chunk_area.box.children) == 3
+
+    chunk_area.update(chunks[0], "updated", delete_chunk)
+    assert chunk_area.box.children[0].children[0].value == "updated"
+
+    removed_tag = chunk_area.tags[chunks[1].id]
+    chunk_area.remove(chunks[1])
+    assert chunks[1] not in chunk_area
+    assert chunk_area.box.children == (
+        chunk_area.tags[chunks[0].id],
+        chunk_area.tags[chunks[2].id],
+    )
+    assert removed_tag.comm is None
+
+    chunk_area.clear()
+    assert len(chunk_area) == 0
+    assert chunk_area.box.children == ()
+
+
+def test_track_interactions():
+    interactions = []
+    annotation = Annotation(
+        ["This is a sentence", "Another one"], on_interaction=interactions.append
+    )
+    annotation.preload_scheduler.wait()
+    assert {"_annotate", "_preload_core"} <= {
+        interaction.name for interaction in interactions
+    }
+    # Preloads are measured on the preloaded document
+    assert {
+        interaction.document_index
+        for interaction in interactions
+        if interaction.name == "_preload_core"
+    } == {0, 1}
+
+    annotation.interaction_stats.reset()
+    interactions.clear()
+    annotation._labelise(None, 0)
+    annotation._labelise(None, 3)
+    annotation._change_document(None, 1)
+    annotation.preload_scheduler.wait()
+
+    stats = annotation.interaction_stats.stats()
+    assert stats["_labelise"]["count"] == 2
+    assert stats["_sync_chunks"]["count"] == 2
+    assert stats["_change_document"]["count"] == 1
+    assert stats["_labelise"]["p50"] <= stats["_labelise"]["p95"]
+    labelise_interactions = [
+        interaction for interaction in interactions if interaction.name == "_labelise"
+    ]
+    assert all(
+        interaction.document_index == 0 for interaction in labelise_interactions
+    )
+    # The second click adds a chunk tag to the chunk area
+    assert labelise_interactions[1].widgets_created > 0
+    assert (
+        labelise_interactions[1].messages > labelise_interactions[1].widgets_created
+    )
+    assert len(interactions) == sum(
+        name_stats["count"] for name_stats in stats.values()
+    )
+    annotation.interaction_stats.close()
+
+
+def test_widget_traffic_counted_while_tracked():
+    open_widget = display.Widget.open
+    stats = InteractionStats()
+    other_stats = InteractionStats()
+    assert display.Widget.open is not open_widget
+
+    stats.close()
+    stats.close()
+    # Still counted for the other stats
+    assert display.Widget.open is not open_widget
+
+    del other_stats
+    gc.collect()
+    assert display.Widget.open is open_widget
+
+
+def test_interactions_not_tracked_by_default():
+    annotation = Annotation(["This is a sentence"])
+    assert annotation.interaction_stats is None
+
+
+def test_autosave(tmp_path, monkeypatch):
+    toasts = []
+    monkeypatch.setattr(
+        display, "show_toast", lambda msg, success: toasts.append(success)
+    )
+    annotation = Annotation(
+        ["Doc 0", "Doc 1", "Doc 2"],
+        save_path=tmp_path / "a.csv",
+        autosave_every=1,
+    )
+    annotation._labelise(None, 0)
+    annotation._change_document(None, 1)
+    annotation.autosave.flush()
+    assert (tmp_path / "a.csv").exists()
+    assert toasts == []
+
+    # The save button saves in the background and shows the toast once saved
+    annotation._save()
+    annotation.autosave.flush()
+    assert toasts == [True]
+
+    annotation._change_document(None, 1)
+    annotation._change_document(None, 1)
+    assert not annotation.autosave.thread.is_alive()
+    assert toasts == [True, True]
+
+
+def test_from_file(tmp_path):
+    file_path = tmp_path / "annotation.csv"
+    pd.DataFrame(
+        {
+            "document": ["Doc 0", "Doc 1"],
+            "labels": [str(["B-l1", "I-l1", "O", "O", "O"]), str(["O"] * 5)],
+            "flag": [True, None],
+        }
+    ).to_csv(file_path, sep=";", index=False)
+
+    annotation = Annotation.from_file(
+        file_path,
+        additional_outputs_elements=[
+            AdditionalOutputElement("flag", "checkbox", "", False)
+        ],
+    )
+    assert annotation.current_index == 1
+    assert annotation.labels[0] == ["B-l1", "I-l1", "O", "O", "O"]
+
+    annotation._change_document(None, -1)
+    assert [chunk.label for chunk in annotation.chunks.chunks] == ["l1"]
+    assert annotation.additional_outputs_elements_displays[0].value is True
+
+
+def test_show_toast():
+    toast = display.prepare_toast()
+    outputs = display.out.outputs
+
+    thread = threading.Thread(target=display.show_toast, args=("Saved <b>", True))
+    thread.start()
+    thread.join()
+    display.show_toast("Saved <b>", True)
+
+    # The toast is a new value of the same widget, nothing is appended to out
+    assert display.toast_widget() is toast
+    assert "snackbar-success" in toast.value
+    assert "Saved &lt;b&gt;" in toast.value
+    assert display.out.outputs == outputs
@@ -1,6 +1,7 @@
 import pytest
 
-from pylighter.chunk_models import Chunk, Chunks
+from pylighter.chunk_models import (Chunk, Chunks, ChunkTable, SpanLabels,
+                                    corpus_labels_to_spans, corpus_spans_to_labels)
 
 
 @pytest.mark.parametrize(
@@ -109,3 +110,146 @@ def test_chunks_to_labels(labels):
     label_output = chunks.to_labels()
 
     assert labels == label_output
+
+
+@pytest.mark.parametrize(
+    "labels, chunk_index, expected",
+    [
+        (["B-Loc", "I-Loc", "O", "B-Loc"], 0, ["O", "O", "O", "B-Loc"]),
+        (["B-Loc", "I-Loc", "O", "B-Loc"], 1, ["B-Loc", "I-Loc", "O", "O"]),
+        (["B-Loc", "B-Loc", "B-Loc", "B-Loc"], 2, ["B-Loc", "B-Loc", "O", "B-Loc"]),
+    ],
+)
+def test_remove_chunk_by_id(labels, chunk_index, expected):
+    chunks = Chunks(labels=labels)
+    chunk_to_remove = chunks.chunks[chunk_index]
+
+    assert chunks.get_chunk_by_id(chunk_to_remove.id) is chunk_to_remove
+
+    chunks.remove_chunk_by_id(chunk_to_remove.id)
+
+    assert chunks.get_chunk_by_id(chunk_to_remove.id) is None
+    assert chunks.to_labels() == expected
+
+
+def test_add_new_chunk_and_update_keeps_chunks_sorted():
+    chunks = Chunks(labels_size=20)
+    for start_index, end_index, label in [
+        (10, 15, "A"),
+        (0, 4, "B"),
+        (12, 12, "C"),
+        (3, 11, "D"),
+        (18, 19, "A"),
+        (16, 18, "B"),
+    ]:
+        chunks.add_new_chunk_and_update(
+            Chunk(start_index=start_index, end_index=end_index, label=label)
+        )
+
+    assert [
+        (chunk.start_index, chunk.end_index, chunk.label) for chunk in chunks.chunks
+    ] == [
+        (0, 2, "B"),
+        (3, 11, "D"),
+        (12, 12, "C"),
+        (13, 15, "A"),
+        (16, 18, "B"),
+        (19, 19, "A"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "labels_list",
+    [
+        [],
+        [[]],
+        [["O", "O", "B-Loc", "I-Loc"], [], ["B-Loc", "B-Loc", "O", "B-Loc"]],
+        [["B-Loc", "I-Loc"], ["I-Loc", "I-Loc", "B-Per"], ["O"]],
+        [["B-Loc", "I-Per", "I-Per", "B-Per"], ["B-Loc", "I-Loc", "I-Loc", "I-Loc"]],
+        [["O", "I-Loc", "O", "B-Per", "I-Per", "O", "I-Per"]],
+    ],
+)
+def test_corpus_labels_to_spans(labels_list):
+    expected = []
+    for labels in labels_list:
+        expected.append(
+            [
+                (chunk.start_index, chunk.end_index, chunk.label)
+                for chunk in Chunks(labels_size=1).labels_to_chunks(labels)
+            ]
+        )
+
+    assert corpus_labels_to_spans(labels_list) == expected
+
+
+@pytest.mark.parametrize(
+    "labels_list",
+    [
+        [],
+        [[]],
+        [["O", "O", "B-Loc", "I-Loc"], [], ["B-Loc", "B-Loc", "O", "B-Loc"]],
+        [["B-Loc", "I-Loc"], ["O"], ["B-Loc", "B-Per", "I-Per", "I-Per"]],
+        [["O", "O", "O"], ["B-Per"]],
+    ],
+)
+def test_corpus_spans_to_labels(labels_list):
+    sizes = [len(labels) for labels in labels_list]
+    spans_list = corpus_labels_to_spans(labels_list)
+
+    assert corpus_spans_to_labels(spans_list, sizes) == labels_list
+
+    for spans, size, labels in zip(spans_list, sizes, labels_list):
+        if size:
+            assert Chunks.from_spans(spans, size).to_labels() == labels
+
+
+def test_span_labels():
+    labels_list = [["O", "B-Loc", "I-Loc"], ["O"], ["B-Per", "B-Loc"]]
+    span_labels = SpanLabels.from_labels(labels_list)
+
+    assert len(span_labels) == 3
+    assert span_labels == labels_list
+    assert list(span_labels) == labels_list
+    assert span_labels[1:] == labels_list[1:]
+    assert span_labels.get_spans(2) == ((0, 0, "Per"), (1, 1, "Loc"))
+
+    span_labels[1] = ["B-Per"]
+    span_labels.set_spans(0, [(0, 2, "Loc")])
+    assert span_labels.to_list() == [
+        ["B-Loc", "I-Loc", "I-Loc"],
+        ["B-Per"],
+        labels_list[2],
+    ]
+
+
+def test_span_labels_empty():
+    span_labels = SpanLabels(sizes=[2, 0, 3])
+
+    assert span_labels == [["O", "O"], [], ["O", "O", "O"]]
+    assert span_labels.get_spans(0) == ()
+
+
+def test_chunk_ids():
+    chunks = [Chunk(start_index=0, end_index=0, label="Loc") for _ in range(1000)]
+
+    assert len({chunk.id for chunk in chunks}) == len(chunks)
+
+    with pytest.raises(AttributeError):
+        chunks[0].unknown_attribute = True
+
+
+def test_chunk_table():
+    labels_list = [["O", "B-Loc", "I-Loc"], [], ["B-Per", "B-Loc", "O"]]
+    chunk_table = ChunkTable.from_labels(labels_list)
+
+    assert len(chunk_table) == 3
+    assert chunk_table.spans(0) == [(1, 2, "Loc")]
+    assert chunk_table.spans(1) == []
+    assert [
+        (chunk.start_index, chunk.end_index, chunk.label)
+        for chunk in chunk_table.chunks(2)
+    ] == [(0, 0, "Per"), (1, 1, "Loc")]
+    assert chunk_table.to_labels([3, 0, 3]) == labels_list
+
+    spans_list = chunk_table.to_spans_list(3)
+    assert ChunkTable.from_spans(spans_list).to_spans_list(3) == spans_list
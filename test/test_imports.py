@@ -0,0 +1,40 @@
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["pandas", "ipywidgets", "IPython"]
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "import pylighter",
+        "from pylighter.chunk_models import Chunks, SpanLabels",
+        "from pylighter import config, utils",
+    ],
+)
+def test_light_imports(statement):
+    # Run in a fresh interpreter, the heavy modules are already imported by the tests
+    code = (
+        f"{statement}; import sys; "
+        f"print([module for module in {HEAVY_MODULES} if module in sys.modules])"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout
+
+    assert output.strip() == "[]"
+
+
+def test_lazy_attributes():
+    import pylighter
+    from pylighter.annotation import Annotation
+    from pylighter.shortcut_helper.shortcut_helper import Shortcut
+
+    assert pylighter.Annotation is Annotation
+    assert pylighter.Shortcut is Shortcut
+    assert pylighter.display.__name__ == "pylighter.display"
+    assert set(pylighter.__all__) <= set(dir(pylighter))
+    with pytest.raises(AttributeError):
+        pylighter.unknown
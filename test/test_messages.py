@@ -0,0 +1,75 @@
+"""
+Budgets of the comm messages sent to the front end by the annotation. Most of the
+display time is spent by the front end on these messages, so their number must not
+grow with the size of the document when it does not need to.
+"""
+from pylighter import Annotation
+
+DOCUMENT = "Some text " * 200  # 2k chars
+
+
+def test_open_document(front_end):
+    with front_end.recording() as messages:
+        Annotation([DOCUMENT], preload_ahead=0, preload_behind=0)
+
+    # A button and its style per char, an HBox and its layout per word, the rest is
+    # constant
+    n_words = len(DOCUMENT.split())
+    assert front_end.count(messages, "comm_open") <= 2 * len(DOCUMENT) + 2 * n_words + 200
+    # The state of the char buttons is sent when they are opened
+    assert front_end.count(messages, "comm_msg") <= 50
+
+
+def test_open_document_html_renderer(front_end):
+    counts = []
+    for document in [DOCUMENT, DOCUMENT * 10]:
+        with front_end.recording() as messages:
+            Annotation([document], preload_ahead=0, preload_behind=0, renderer="html")
+        counts.append(front_end.counts(messages))
+
+    assert counts[0] == counts[1]
+    assert sum(counts[0].values()) <= 150
+
+
+def test_labelise(front_end):
+    annotation = Annotation([DOCUMENT], preload_ahead=0, preload_behind=0)
+
+    with front_end.recording() as messages:
+        annotation._labelise(None, 0)
+        annotation._labelise(None, 9)
+
+    # One message per highlighted char, and the tags of the chunks
+    assert front_end.count(messages, "comm_msg") <= 1 + 10 + 15
+    assert len(messages) <= 60
+
+    with front_end.recording() as messages:
+        annotation._delete_chunk(None, annotation.chunks.chunks[0])
+
+    assert front_end.count(messages, "comm_msg") <= 10 + 5
+    assert len(messages) <= 25
+
+
+def test_change_document(front_end):
+    annotation = Annotation(
+        [DOCUMENT, "Another document"], preload_ahead=0, preload_behind=0
+    )
+
+    with front_end.recording() as messages:
+        annotation._change_document(None, 1)
+
+    # Nothing is sent for the chars of the document left
+    assert len(messages) <= 200
+
+
+def test_change_document_persistent_shell(front_end):
+    annotation = Annotation(
+        [DOCUMENT, DOCUMENT], preload_ahead=1, preload_behind=0, persistent_shell=True
+    )
+    annotation.preload_scheduler.wait()
+
+    with front_end.recording() as messages:
+        annotation._change_document(None, 1)
+
+    # The next document is preloaded and the shell stays, no widget is created
+    assert front_end.count(messages, "comm_open") == 0
+    assert len(messages) <= 25
@@ -0,0 +1,250 @@
+import pandas as pd
+import pytest
+
+from pylighter import AdditionalOutputElement, AnnotationSession, display
+from pylighter.storage import JournalStorage
+
+
+def test_session_does_not_create_widgets():
+    live_widgets = display.live_widgets_stats()["widgets"]
+    session = AnnotationSession(["This is a sentence"] * 3)
+    session.labelise(0)
+    session.labelise(3)
+    session.change_document(1)
+
+    assert display.live_widgets_stats()["widgets"] == live_widgets
+
+
+@pytest.mark.parametrize(
+    "label, clicks, expected",
+    [
+        ("l1", [0, 3], ["B-l1", "I-l1", "I-l1", "I-l1", "O", "O", "O"]),
+        ("l2", [3, 1], ["O", "B-l2", "I-l2", "I-l2", "O", "O", "O"]),
+        ("l1", [5], ["O", "O", "O", "O", "O", "B-l1", "O"]),
+    ],
+)
+def test_labelise(label, clicks, expected):
+    session = AnnotationSession(["Some te"])
+    session.select_label(label)
+    for char_index in clicks:
+        update = session.labelise(char_index)
+
+    assert update.added
+    assert session.chunks.to_labels() == expected
+
+
+def test_labelise_split():
+    session = AnnotationSession(["Some text"], labels=[["B-l1"] + ["I-l1"] * 8])
+    session.select_label(None)
+    session.labelise(2)
+    update = session.labelise(3)
+
+    assert not update.added
+    assert sorted(
+        (chunk.start_index, chunk.end_index) for chunk in update.updated_chunks
+    ) == [(4, 8)]
+    assert session.chunks.to_labels() == ["B-l1", "I-l1", "O", "O", "B-l1"] + [
+        "I-l1"
+    ] * 4
+
+
+def test_change_document():
+    session = AnnotationSession(
+        ["Doc 0", "Doc 1"],
+        additional_outputs_elements=[
+            AdditionalOutputElement("flag", "checkbox", "Flag", default_value=False)
+        ],
+    )
+    assert not session.change_document(-1)
+
+    session.labelise(0)
+    session.labelise(2)
+    assert session.change_document(1, additional_outputs={"flag": True})
+    assert session.document == "Doc 1"
+    assert session.labels[0] == ["B-l1", "I-l1", "I-l1", "O", "O"]
+    assert session.additional_outputs_values.iloc[0]["flag"]
+
+    session.labelise(4)
+    session.change_document(1, skip=True)
+    assert session.finished
+    assert session.labels[1] == ["O"] * 5
+
+
+def test_clear_current_and_save(tmp_path):
+    session = AnnotationSession(
+        ["Some text"], labels=[["B-l2"] + ["I-l2"] * 3 + ["O"] * 5]
+    )
+    session.select_label("l3")
+    session.clear_current()
+    assert session.chunks.to_labels() == ["O"] * 9
+    assert session.selected_labeliser == "l3"
+
+    session.change_document(1)
+    file_path = session.save(tmp_path / "annotation.csv")
+    assert pd.read_csv(file_path, sep=";")["labels"].tolist() == [str(["O"] * 9)]
+
+
+def test_save_spans(tmp_path):
+    session = AnnotationSession(
+        ["Some text", "Doc"],
+        labels=[["B-l2"] + ["I-l2"] * 3 + ["O"] * 5, ["O"] * 3],
+        labels_format="spans",
+    )
+    file_path = session.save(tmp_path / "annotation.csv")
+    assert pd.read_csv(file_path, sep=";")["spans"].tolist() == ['[[0,3,"l2"]]', "[]"]
+
+    with pytest.raises(ValueError):
+        AnnotationSession(["Some text"], labels_format="rle")
+
+
+def test_from_file(tmp_path):
+    file_path = tmp_path / "annotation.csv"
+    session = AnnotationSession(
+        ["Doc 0", "Doc 1", "Doc 2"],
+        additional_outputs_elements=[
+            AdditionalOutputElement("flag", "checkbox", "", False)
+        ],
+        save_path=file_path,
+        labels_format="spans",
+    )
+    session.labelise(0)
+    session.labelise(2)
+    session.additional_outputs_values.loc[0, "flag"] = True
+    session.change_document(1)
+    session.save()
+
+    session = AnnotationSession.from_file(file_path, labels_names=["l1", "l2"])
+    assert session.current_index == 1
+    assert session.save_path == file_path
+    assert session.labels_format == "spans"
+    assert session.labels[0] == ["B-l1", "I-l1", "I-l1", "O", "O"]
+    assert session.additional_outputs_values["flag"].tolist()[0] is True
+    assert session.additional_outputs_values["flag"].isna().tolist()[1:] == [True] * 2
+
+    session.labelise(0)
+    session.change_document(1)
+    session.save()
+    assert AnnotationSession.from_file(file_path).current_index == 2
+
+
+def test_from_file_edit_typed_values(tmp_path):
+    file_path = tmp_path / "annotation.csv"
+    pd.DataFrame(
+        {
+            "document": ["Doc 0", "Doc 1"],
+            "labels": [str(["O"] * 5)] * 2,
+            "flag": [True, False],
+            "note": ["a", "b"],
+        }
+    ).to_csv(file_path, sep=";", index=False)
+
+    session = AnnotationSession.from_file(
+        file_path,
+        additional_outputs_elements=[
+            AdditionalOutputElement("flag", "checkbox", "", False),
+            AdditionalOutputElement("note", "text", "", ""),
+        ],
+    )
+    session.change_document(1, additional_outputs={"flag": False, "note": "z"})
+    assert session.additional_outputs_values.iloc[0].tolist() == [False, "z"]
+    assert session.dirty == {0}
+
+
+def test_commit_nullable_additional_outputs():
+    session = AnnotationSession(
+        ["Doc 0", "Doc 1"],
+        start_index=1,
+        additional_outputs_values=pd.DataFrame(
+            {
+                "flag": pd.array([True, None], dtype="boolean"),
+                "count": pd.array([None, 2], dtype="Int64"),
+                "note": pd.array(["a", None], dtype="string"),
+            }
+        ),
+    )
+    # Missing values are equal to each other
+    session.change_document(-1, additional_outputs={"flag": None, "count": 2})
+    assert session.dirty == set()
+
+    session.change_document(1, additional_outputs={"flag": False, "note": "a"})
+    assert session.dirty == {0}
+    assert session.additional_outputs_values["flag"].tolist()[:1] == [False]
+
+
+def test_dirty_documents():
+    session = AnnotationSession(
+        ["Doc 0", "Doc 1", "Doc 2"],
+        additional_outputs_elements=[
+            AdditionalOutputElement("flag", "checkbox", "Flag", default_value=False)
+        ],
+    )
+    session.change_document(1)
+    session.change_document(1)
+    assert session.dirty == set()
+
+    session.change_document(-1, additional_outputs={"flag": True})
+    session.labelise(0)
+    session.change_document(-1)
+    assert session.dirty == {1, 2}
+
+    # Same values as the saved ones
+    session.change_document(1)
+    session.change_document(1)
+    session.dirty.clear()
+    session.change_document(-1, additional_outputs={"flag": True})
+    assert session.dirty == set()
+
+
+def test_save_to_storage(tmp_path):
+    corpus = ["Doc 0", "Doc 1", "Doc 2"]
+    storage = JournalStorage(tmp_path / "journal.jsonl")
+    session = AnnotationSession(corpus, storage=storage)
+    session.labelise(0)
+    session.change_document(1)
+    session.change_document(1)
+
+    assert session.save() == storage.path
+    assert session.dirty == set()
+    assert list(storage.load()) == [0]
+
+    # Nothing changed since the last save
+    session.save()
+    assert storage.n_records == 1
+
+    restored = AnnotationSession(corpus, storage=JournalStorage(storage.path))
+    assert restored.labels == session.labels
+
+    with pytest.raises(ValueError):
+        AnnotationSession(["Other"] * 3, storage=JournalStorage(storage.path))
+
+
+def test_snapshot(tmp_path):
+    session = AnnotationSession(["Doc 0", "Doc 1"], save_path=tmp_path / "a.csv")
+    session.labelise(0)
+    session.change_document(1)
+    snapshot = session.snapshot()
+    assert snapshot.dirty == {0}
+    assert not session.dirty
+
+    # Changes after the snapshot are not in it
+    session.labelise(0)
+    session.change_document(-1)
+    assert snapshot.labels[1] == ["O"] * 5
+    assert session.dirty == {1}
+
+    session.write_snapshot(snapshot)
+    saved = pd.read_csv(tmp_path / "a.csv", sep=";")
+    assert saved["labels"][1] == str(["O"] * 5)
+    assert not (tmp_path / "a.csv.tmp").exists()
+
+
+def test_export_does_not_save_to_storage(tmp_path):
+    session = AnnotationSession(
+        ["Doc 0"], storage=JournalStorage(tmp_path / "journal.jsonl")
+    )
+    session.labelise(0)
+    session.commit()
+    session.save(tmp_path / "export.csv")
+
+    assert session.dirty == {0}
+    assert session.storage.load() == {}
@@ -0,0 +1,215 @@
+import sqlite3
+import time
+
+import pandas as pd
+import pytest
+
+from pylighter import AdditionalOutputElement, AnnotationSession
+from pylighter.storage import Autosave, DocumentRecord, JournalStorage, SQLiteStorage
+
+STORAGES = {
+    "journal": lambda directory: JournalStorage(directory / "annotation.jsonl"),
+    "sqlite": lambda directory: SQLiteStorage(directory / "annotation.db"),
+}
+
+
+def make_record(index, label="l1"):
+    return DocumentRecord(
+        index=index,
+        document=f"Document {index}",
+        spans=[(0, 7, label)],
+        additional_outputs={"flag": index % 2 == 0},
+    )
+
+
+@pytest.mark.parametrize("storage_name", STORAGES)
+def test_storage(tmp_path, storage_name):
+    storage = STORAGES[storage_name](tmp_path)
+    assert storage.load() == {}
+    assert storage.current_index is None
+
+    storage.write([make_record(0), make_record(1)], current_index=2)
+    storage.write([make_record(0, label="l2")], current_index=1)
+    storage.close()
+
+    reopened = STORAGES[storage_name](tmp_path)
+    records = reopened.load()
+    assert records == {0: make_record(0, label="l2"), 1: make_record(1)}
+    assert reopened.current_index == 1
+
+
+@pytest.mark.parametrize("storage_name", STORAGES)
+def test_resume_session(tmp_path, storage_name):
+    corpus = ["Doc 0", "Doc 1", "Doc 2"]
+    session = AnnotationSession(corpus, storage=STORAGES[storage_name](tmp_path))
+    session.labelise(0)
+    session.change_document(1)
+    session.change_document(1)
+    session.save()
+    session.storage.close()
+
+    resumed = AnnotationSession(corpus, storage=STORAGES[storage_name](tmp_path))
+    assert resumed.current_index == 2
+    assert resumed.labels == session.labels
+    assert not resumed.dirty
+
+    restarted = AnnotationSession(
+        corpus, start_index=0, storage=STORAGES[storage_name](tmp_path)
+    )
+    assert restarted.current_index == 0
+
+
+@pytest.mark.parametrize("storage_name", STORAGES)
+def test_resume_typed_additional_outputs(tmp_path, storage_name):
+    corpus = ["Doc 0", "Doc 1"]
+
+    def open_session():
+        return AnnotationSession(
+            corpus,
+            additional_outputs_values=pd.DataFrame({"n": [1, 2], "note": ["a", "b"]}),
+            additional_outputs_elements=[
+                AdditionalOutputElement("n", "int_text", "", 0),
+                AdditionalOutputElement("note", "text", "", ""),
+            ],
+            storage=STORAGES[storage_name](tmp_path),
+        )
+
+    session = open_session()
+    session.change_document(1, additional_outputs={"n": 9, "note": "a"})
+    session.save()
+    session.storage.close()
+
+    resumed = open_session()
+    assert resumed.additional_outputs_values.iloc[0].tolist() == [9, "a"]
+    resumed.storage.close()
+
+    # The outputs removed since the save are not restored
+    without_note = AnnotationSession(
+        corpus,
+        additional_outputs_values=pd.DataFrame({"n": [1, 2]}),
+        storage=STORAGES[storage_name](tmp_path),
+    )
+    assert without_note.additional_outputs_values["n"].tolist() == [9, 2]
+
+
+def test_journal_storage_ignores_cut_line(tmp_path):
+    storage = JournalStorage(tmp_path / "journal.jsonl")
+    storage.write([make_record(0)])
+    with open(storage.path, "a") as journal:
+        journal.write('{"index": 1, "docu')
+
+    assert storage.load() == {0: make_record(0)}
+
+    # The records written after the cut line are kept
+    storage.write([make_record(2)], current_index=2)
+    reopened = JournalStorage(storage.path)
+    assert reopened.load() == {0: make_record(0), 2: make_record(2)}
+    assert reopened.current_index == 2
+
+
+def test_journal_storage_corrupted_line(tmp_path):
+    storage = JournalStorage(tmp_path / "journal.jsonl")
+    storage.write([make_record(0)])
+    with open(storage.path, "a") as journal:
+        journal.write('{"index": 1, "docu\n')
+    storage.write([make_record(2)])
+
+    with pytest.raises(ValueError, match="Corrupted record"):
+        JournalStorage(storage.path).load()
+
+
+@pytest.mark.parametrize("n_saves, expected_lines", [(2, 4), (3, 2), (4, 4)])
+def test_journal_storage_compaction(tmp_path, n_saves, expected_lines):
+    storage = JournalStorage(
+        tmp_path / "journal.jsonl", compact_ratio=2, min_compact_records=4
+    )
+    for save in range(n_saves):
+        storage.write([make_record(0, label=f"l{save}"), make_record(1)])
+
+    with open(storage.path) as journal:
+        assert len(journal.readlines()) == expected_lines
+    assert storage.load()[0] == make_record(0, label=f"l{n_saves - 1}")
+    # No temporary file left behind
+    assert [path.name for path in tmp_path.iterdir()] == ["journal.jsonl"]
+
+
+def test_sqlite_storage_read_while_writing(tmp_path):
+    storage = SQLiteStorage(tmp_path / "annotation.db")
+    storage.write([make_record(0)], current_index=1)
+
+    # Another process can follow the progress of the session
+    reader = sqlite3.connect(tmp_path / "annotation.db")
+    assert reader.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    reader.execute("BEGIN")
+    assert reader.execute("SELECT COUNT(*) FROM documents").fetchone() == (1,)
+
+    storage.write([make_record(1), make_record(2)])
+    assert reader.execute("SELECT COUNT(*) FROM documents").fetchone() == (1,)
+    reader.execute("COMMIT")
+    assert reader.execute("SELECT COUNT(*) FROM documents").fetchone() == (3,)
+    reader.close()
+
+
+def test_autosave_every(tmp_path):
+    saved = []
+    session = AnnotationSession(
+        ["Doc 0", "Doc 1", "Doc 2"], storage=SQLiteStorage(tmp_path / "annotation.db")
+    )
+    autosave = Autosave(session, every=2, on_save=saved.append)
+
+    session.labelise(0)
+    session.change_document(1)
+    autosave.document_changed()
+    autosave.flush()
+    assert session.storage.load() == {}
+
+    session.labelise(1)
+    session.change_document(1)
+    autosave.document_changed()
+    autosave.flush()
+    assert list(session.storage.load()) == [0, 1]
+    assert not session.dirty
+    # Only the saves requested with notify are notified
+    assert saved == []
+
+    autosave.request(notify=True)
+    autosave.stop()
+    assert saved == [session.storage.path]
+    assert not autosave.thread.is_alive()
+
+
+def test_autosave_interval(tmp_path, monkeypatch):
+    session = AnnotationSession(["Doc 0", "Doc 1"], save_path=tmp_path / "a.csv")
+    snapshots = []
+    snapshot = session.snapshot
+    monkeypatch.setattr(session, "snapshot", lambda: snapshots.append(1) or snapshot())
+    autosave = Autosave(session, interval=0.01)
+    session.labelise(0)
+    session.change_document(1)
+
+    for _ in range(100):
+        if (tmp_path / "a.csv").exists():
+            break
+        time.sleep(0.01)
+    # Without changes, the session is not copied again
+    time.sleep(0.1)
+    autosave.stop()
+
+    assert [path.name for path in tmp_path.iterdir()] == ["a.csv"]
+    assert len(snapshots) == 1
+
+
+def test_autosave_error(tmp_path):
+    errors = []
+    session = AnnotationSession(
+        ["Doc 0", "Doc 1"], save_path=tmp_path / "missing" / "a.csv"
+    )
+    autosave = Autosave(session, on_error=errors.append)
+    session.labelise(0)
+    session.change_document(1)
+    autosave.request()
+    autosave.stop()
+
+    assert len(errors) == 1
+    # Saved with the next save
+    assert session.dirty == {0}
@@ -1,6 +1,13 @@
+import csv
+import os
+import stat
+import threading
+
+import pandas as pd
 import pytest
 
 from pylighter import utils
+from pylighter.chunk_models import Chunks, SpanLabels
 
 
 def test_text_parser():
@@ -99,3 +106,251 @@ def test_assert_IOB2_format(labels, expects_assert_error):
             utils.assert_IOB2_format([labels])
     else:
         utils.assert_IOB2_format([labels])
+
+
+def test_PreloadedDisplays():
+    dropped = []
+    preloaded_displays = utils.PreloadedDisplays(
+        preload_ahead=2, preload_behind=1, max_documents=4, on_drop=dropped.append
+    )
+
+    assert preloaded_displays.window(0, 10) == [0, 1, 2]
+    assert preloaded_displays.window(5, 7) == [5, 6, 4]
+
+    for index in [0, 1, 2, 3, 4]:
+        preloaded_displays.get(index, size=10)["index"] = index
+    preloaded_displays.get(0, size=10, count=True)
+    preloaded_displays.get(5, size=10, count=True)
+    preloaded_displays.evict(protected=[5, 1])
+
+    assert list(preloaded_displays.displays) == [1, 4, 0, 5]
+    assert dropped == [{"index": 2}, {"index": 3}]
+    assert preloaded_displays.stats() == {
+        "hits": 1,
+        "misses": 1,
+        "hit_rate": 0.5,
+        "documents": 4,
+        "chars": 40,
+    }
+
+
+def test_PreloadScheduler():
+    started = threading.Event()
+    release = threading.Event()
+    loaded = []
+
+    def load(document_index):
+        if document_index == 0:
+            started.set()
+            release.wait()
+        loaded.append(document_index)
+
+    preload_scheduler = utils.PreloadScheduler(max_workers=1)
+    preload_scheduler.submit(0, load, document_index=0)
+    started.wait()
+    for index in [1, 2, 3]:
+        preload_scheduler.submit(index, load, document_index=index)
+    # Already being preloaded
+    preload_scheduler.submit(3, load, document_index=3)
+
+    # The document about to be displayed does not wait behind the others
+    preload_scheduler.run_now(2, load, document_index=2)
+    assert loaded == [2]
+
+    preload_scheduler.cancel_stale(keep=[0, 3])
+    release.set()
+    preload_scheduler.wait()
+    assert loaded == [2, 0, 3]
+
+    preload_scheduler.shutdown()
+    assert preload_scheduler.futures == {}
+
+
+def test_PreloadScheduler_failed_preload():
+    calls = []
+
+    def load(fail):
+        calls.append(fail)
+        if fail:
+            raise RuntimeError("Preload failed")
+
+    preload_scheduler = utils.PreloadScheduler(max_workers=1)
+    preload_scheduler.submit(0, load, fail=True)
+    preload_scheduler.wait()
+    # Wait for the preload to fail
+    preload_scheduler.submit(1, load, fail=True).exception()
+    # The failed preload is loaded again in the current thread
+    preload_scheduler.run_now(1, load, fail=False)
+    assert calls == [True, True, False]
+    preload_scheduler.shutdown()
+
+
+def test_PreloadScheduler_when_done():
+    started = threading.Event()
+    release = threading.Event()
+    dropped = []
+
+    def load():
+        started.set()
+        release.wait()
+
+    preload_scheduler = utils.PreloadScheduler(max_workers=1)
+    preload_scheduler.submit(0, load)
+    preload_scheduler.submit(1, load)
+    started.wait()
+
+    preloaded_displays = utils.PreloadedDisplays(
+        max_documents=0, on_drop=dropped.append
+    )
+    preloaded_displays.get(0, size=10)["index"] = 0
+    preloaded_displays.get(1, size=10)["index"] = 1
+    # Evicting does not wait for the running preload
+    preloaded_displays.evict(defer=preload_scheduler.when_done)
+    assert len(preloaded_displays) == 0
+    assert 0 not in preload_scheduler
+    # The pending preload is cancelled and its display released at once
+    assert dropped == [{"index": 1}]
+
+    release.set()
+    preload_scheduler.shutdown()
+    assert sorted(display["index"] for display in dropped) == [0, 1]
+
+
+def test_load_template():
+    utils.load_template.cache_clear()
+    parts = utils.load_template("toast/toast.html")
+    assert parts[1::2] == ("toast_id", "success_type", "toast_msg")
+
+    utils.text_parser("toast/toast.html", success_type="success")
+    assert utils.load_template.cache_info().misses == 1
+    assert "<% toast_msg %>" in utils.text_parser("toast/toast.html")
+
+
+def test_annotation_to_csv_replaces_regular_files_only(tmp_path):
+    target = tmp_path / "annotation.csv"
+    target.write_text("previous save")
+    target.chmod(0o640)
+    link = tmp_path / "link.csv"
+    link.symlink_to(target)
+
+    utils.annotation_to_csv(["Doc"], [["O"] * 3], None, link)
+    assert link.is_symlink()
+    assert pd.read_csv(target, sep=";")["document"].tolist() == ["Doc"]
+    assert stat.S_IMODE(target.stat().st_mode) == 0o640
+    # No temporary file left behind
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "annotation.csv",
+        "link.csv",
+    ]
+
+    # New files get the mode of the files created by open
+    created = tmp_path / "created"
+    created.touch()
+    utils.annotation_to_csv(["Doc"], [["O"] * 3], None, tmp_path / "new.csv")
+    assert (tmp_path / "new.csv").stat().st_mode == created.stat().st_mode
+
+    utils.annotation_to_csv(["Doc"], [["O"] * 3], None, os.devnull)
+    assert not os.path.isfile(os.devnull)
+
+
+@pytest.mark.parametrize(
+    "labels",
+    [
+        [],
+        ["O", "B-l1", "I-l1"],
+        ["B-it's", "I-it's", "O"],
+        ['B-a "b"', "O"],
+        ["B-a, b", "O"],
+    ],
+)
+def test_decode_iob2_labels(labels):
+    assert utils.decode_iob2_labels(str(labels)) == labels
+
+
+@pytest.mark.parametrize("labels_format", ["iob2", "spans"])
+def test_read_annotation_csv(tmp_path, labels_format):
+    corpus = ["Some text", "Another; text\nwith a new line", ""]
+    labels = SpanLabels(
+        [len(document) for document in corpus],
+        [[(0, 3, "l1"), (5, 8, "l2")], [], []],
+    )
+    additional_outputs_values = pd.DataFrame({"flag": [True, None, False]})
+    file_path = tmp_path / "annotation.csv"
+    utils.annotation_to_csv(
+        corpus, labels, additional_outputs_values, file_path, labels_format
+    )
+
+    field_size_limit = csv.field_size_limit()
+    read_corpus, read_labels, columns, read_format = utils.read_annotation_csv(
+        file_path
+    )
+    assert csv.field_size_limit() == field_size_limit
+    assert read_format == labels_format
+    assert read_corpus == corpus
+    assert read_labels == labels
+    assert read_labels[0] == ["B-l1"] + ["I-l1"] * 3 + ["O", "B-l2"] + ["I-l2"] * 3
+    chunks = Chunks.from_spans(read_labels.get_spans(0), len(corpus[0]))
+    assert chunks.to_spans() == [(0, 3, "l1"), (5, 8, "l2")]
+    assert columns == {"flag": ["True", "", "False"]}
+
+
+def test_spans_labels_format_size(tmp_path):
+    corpus = ["Some text " * 100] * 10
+    labels = SpanLabels([len(document) for document in corpus], [[(0, 3, "l1")]] * 10)
+    sizes = {}
+    for labels_format in ["iob2", "spans"]:
+        file_path = tmp_path / f"{labels_format}.csv"
+        utils.annotation_to_csv(corpus, labels, None, file_path, labels_format)
+        sizes[labels_format] = os.path.getsize(file_path)
+
+    assert sizes["spans"] * 5 < sizes["iob2"]
+
+    with pytest.raises(ValueError):
+        utils.annotation_to_csv(corpus, labels, None, file_path, "rle")
+
+
+@pytest.mark.parametrize(
+    "values, display_type, expected",
+    [
+        (["True", "", "False"], None, [True, None, False]),
+        (["True", "", "False"], "checkbox", [True, None, False]),
+        (["1", "", "3"], None, [1, None, 3]),
+        (["1.5", "2"], "float_text", [1.5, 2]),
+        (["12", ""], "text", ["12", None]),
+        (["a", "12"], None, ["a", "12"]),
+    ],
+)
+def test_parse_additional_output(values, display_type, expected):
+    column = utils.parse_additional_output(values, display_type)
+    assert [None if pd.isna(value) else value for value in column] == expected
+
+
+@pytest.mark.parametrize("labels_format", ["iob2", "spans"])
+def test_load_annotation(tmp_path, labels_format):
+    corpus = ["Doc 0", "Doc 1", "Doc 2"]
+    labels = SpanLabels([5, 5, 5], [[(0, 2, "l1")], [], [(4, 4, "l2")]])
+    additional_outputs_values = pd.DataFrame(
+        {"flag": [True, None, None], "comment": ["1", "a", None]}
+    )
+    file_path = tmp_path / "annotation.csv"
+    utils.annotation_to_csv(
+        corpus, labels, additional_outputs_values, file_path, labels_format
+    )
+
+    loaded = utils.load_annotation(
+        file_path,
+        [
+            utils.AdditionalOutputElement("comment", "text", "", ""),
+            utils.AdditionalOutputElement("count", "int_text", "", 0),
+        ],
+    )
+    assert loaded["corpus"] == corpus
+    assert loaded["labels"] == labels
+    assert loaded["labels_format"] == labels_format
+    # The first document without any chunk
+    assert loaded["start_index"] == 1
+    values = loaded["additional_outputs_values"]
+    assert list(values.columns) == ["flag", "comment", "count"]
+    assert values["flag"].tolist()[0] is True
+    assert values["comment"].tolist()[:2] == ["1", "a"]
+    assert values["count"].isna().all()